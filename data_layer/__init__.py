@@ -0,0 +1 @@
+"""Shared data loading and preparation used by the upload page and the dashboard pages."""
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.filters import FilterEngine
+from data_layer.indexes import sorted_merge_positions
+from data_layer.rollup import build_daily_rollup
+from data_layer.schema import combine_chunks
+from data_layer.sessions import build_session_table
+from data_layer.settings import APPROXIMATE_DISTINCT_ERROR
+from data_layer.users import build_user_visits
+
+# Two log lines with the same session, timestamp and page are the same event
+EVENT_KEY = ["session_id", "timestamp", "page_name"]
+
+
+def _event_keys(df):
+    columns = [column for column in EVENT_KEY if column in df.columns]
+    # Compare labels, not codes: the two frames have their own categories
+    return pd.MultiIndex.from_arrays([df[column].astype(object) for column in columns])
+
+
+def drop_known_events(df, batch):
+    """The events of a prepared batch that are neither repeated within it nor already in ``df``.
+
+    Both frames are sorted by timestamp, so only the rows of ``df`` within the batch's time
+    span are compared.
+    """
+    batch = batch[~_event_keys(batch).duplicated()]
+    if len(batch) == 0 or len(df) == 0:
+        return batch.reset_index(drop=True)
+    timestamps = df["timestamp"]
+    start = timestamps.searchsorted(batch["timestamp"].iloc[0], side="left")
+    stop = timestamps.searchsorted(batch["timestamp"].iloc[-1], side="right")
+    known = _event_keys(df.iloc[start:stop])
+    return batch[~_event_keys(batch).isin(known)].reset_index(drop=True)
+
+
+def merge_batch(df, batch):
+    """Merge a prepared batch into the time-sorted dataset.
+
+    Returns the merged frame and, for the rows of ``df`` and of ``batch``, their positions in
+    it. A batch that starts after the dataset ends (the usual daily append) is simply added
+    at the end; otherwise its rows are slotted in by timestamp.
+    """
+    if set(batch.columns) != set(df.columns):
+        raise ValueError("The appended file's columns don't match the current dataset.")
+    batch = batch[list(df.columns)]
+    positions, batch_positions = sorted_merge_positions(df["timestamp"].to_numpy(), batch["timestamp"].to_numpy())
+    merged = combine_chunks([df, batch])
+    if len(df) and len(batch) and batch_positions[0] < len(df):
+        order = np.empty(len(merged), dtype=np.int64)
+        order[positions] = np.arange(len(df))
+        order[batch_positions] = np.arange(len(df), len(merged))
+        merged = merged.take(order).reset_index(drop=True)
+    return merged, positions, batch_positions
+
+
+# How each artifact kept by the store (see get_artifact) is brought up to date for an appended
+# batch: update(artifact, merged, batch, positions, batch_positions). Artifacts not listed
+# here are rebuilt on first use.
+ARTIFACT_UPDATES = {
+    "daily_rollup": lambda rollup, merged, batch, positions, batch_positions: rollup.merge(build_daily_rollup(batch)),
+    "daily_rollup_approximate": lambda rollup, merged, batch, positions, batch_positions: rollup.merge(
+        build_daily_rollup(batch, APPROXIMATE_DISTINCT_ERROR)
+    ),
+    "filter_engine": lambda engine, merged, batch, positions, batch_positions: engine.merge(
+        merged, FilterEngine(batch), positions, batch_positions
+    ),
+    "user_visits": lambda visits, merged, batch, positions, batch_positions: visits.merge(build_user_visits(batch)),
+    "session_table": lambda table, merged, batch, positions, batch_positions: table.merge(build_session_table(batch)),
+}
+
+
+def append_new_events(df, artifacts, batch):
+    """Append a batch of new events (see ``drop_known_events``) to a dataset and update its
+    artifacts for them only. Returns the merged frame and the updated artifacts."""
+    merged, positions, batch_positions = merge_batch(df, batch)
+    updated = {
+        name: ARTIFACT_UPDATES[name](artifact, merged, batch, positions, batch_positions)
+        for name, artifact in artifacts.items()
+        if name in ARTIFACT_UPDATES
+    }
+    return merged, updated
+
+
+def append_batch(df, artifacts, batch):
+    """Append a prepared batch to a dataset and update its artifacts for the new events only.
+
+    Returns the merged frame, the updated artifacts and the batch's new events. Events already
+    in the dataset are dropped first; a batch with nothing new raises ValueError.
+    """
+    batch = drop_known_events(df, batch)
+    if len(batch) == 0:
+        raise ValueError("The appended file contains no events that aren't already in the dataset.")
+    merged, updated = append_new_events(df, artifacts, batch)
+    return merged, updated, batch
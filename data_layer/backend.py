@@ -0,0 +1,366 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import streamlit as st
+from pyarrow import acero, fs
+
+from data_layer.filters import filter_key, get_filter_engine
+from data_layer.settings import OUT_OF_CORE_COUNT_ENTRIES
+from data_layer.store import get_dataset_handle
+
+# Rows per batch when a dataset is streamed through pandas (e.g. to build the rollup of an
+# out-of-core dataset, or to write an export)
+SCAN_BATCH_ROWS = 1_000_000
+
+# Row conditions a query can add on top of a filter state, as (column, op, value) triples:
+#   "=="        value equals ``value`` (missing values never match)
+#   "!="        value differs from ``value`` (missing values count as different, as in pandas)
+#   "notna"     value is present (``value`` is ignored)
+#   "contains"  value's text contains ``value``, ignoring case (missing values never match)
+CONDITION_OPS = ("==", "!=", "notna", "contains")
+
+
+def _check_op(op):
+    if op not in CONDITION_OPS:
+        raise ValueError(f"Unknown condition {op!r}; expected one of {', '.join(CONDITION_OPS)}.")
+
+
+def _contains_mask(values, text):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Search the categories once instead of every row's label
+        lookup = np.zeros(len(values.cat.categories) + 1, dtype=bool)
+        lookup[:-1] = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        return lookup[values.cat.codes.to_numpy()]
+    return (values.notna() & values.astype(str).str.contains(text, case=False, regex=False)).to_numpy(dtype=bool)
+
+
+def condition_mask(frame, where):
+    """Boolean array of the rows of ``frame`` meeting every (column, op, value) condition."""
+    mask = np.ones(len(frame), dtype=bool)
+    for column, op, value in where:
+        _check_op(op)
+        if op == "==":
+            mask &= (frame[column] == value).to_numpy(dtype=bool)
+        elif op == "!=":
+            mask &= (frame[column] != value).to_numpy(dtype=bool)
+        elif op == "contains":
+            mask &= _contains_mask(frame[column], value)
+        else:
+            mask &= frame[column].notna().to_numpy()
+    return mask
+
+
+class FrameBackend:
+    """Queries over a dataset held in memory, answered by its FilterEngine and pandas."""
+
+    out_of_core = False
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.columns = engine.df.columns.tolist()
+        # Row positions of the last searched and the last sorted query, so paging through a
+        # result doesn't filter or sort it again
+        self._positions_key = self._sorted_key = None
+        self._positions = self._sorted = None
+
+    def key(self, date_range=None, **selections):
+        return self.engine.key(date_range, **selections)
+
+    def date_range(self):
+        return self.engine.first_date, self.engine.last_date
+
+    def options(self, column):
+        return self.engine.options(column)
+
+    def _take(self, columns, rows):
+        # Column by column: selecting the columns first (df[columns]) would copy them whole
+        df = self.engine.df
+        columns = dict.fromkeys(columns)
+        if isinstance(rows, slice):
+            return pd.DataFrame({column: df[column].iloc[rows] for column in columns})
+        return pd.DataFrame({column: df[column].take(rows) for column in columns})
+
+    def _columns(self, key, columns, where=()):
+        # Only the columns a query reads, for the matching rows only
+        rows = self._matching_positions(key, where) if where else self.engine.select(key)
+        return self._take(columns, rows)
+
+    def _matching_positions(self, key, where=()):
+        query = (key, tuple(where))
+        if query != self._positions_key:
+            rows = self.engine.select(key)
+            positions = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows
+            if where:
+                # Only the columns the conditions refer to are read, and only for the selected rows
+                columns = list(dict.fromkeys(column for column, _, _ in where))
+                positions = positions[condition_mask(self._take(columns, positions), where)]
+            self._positions_key, self._positions = query, positions
+        return self._positions
+
+    def _sorted_positions(self, key, where, order_by, descending):
+        query = (key, tuple(where), order_by, descending)
+        if query != self._sorted_key:
+            positions = self._matching_positions(key, where)
+            values = self.engine.df[order_by].take(positions).reset_index(drop=True)
+            order = values.sort_values(ascending=not descending, kind="stable", na_position="last").index
+            self._sorted_key, self._sorted = query, positions[order.to_numpy()]
+        return self._sorted
+
+    def count(self, key, by=None, where=()):
+        """Number of matching events, or a Series of counts per value of ``by`` (a column or list)."""
+        if by is None:
+            # A count is the size of the (memoized) selection, narrowed by the conditions; no rows are taken
+            if where:
+                return len(self._matching_positions(key, where))
+            rows = self.engine.select(key)
+            return len(range(len(self.engine.df))[rows]) if isinstance(rows, slice) else len(rows)
+        keys = [by] if isinstance(by, str) else list(by)
+        return self._columns(key, keys, where).groupby(by, observed=True).size()
+
+    def nunique(self, key, column, where=()):
+        """Number of distinct non-missing values of ``column`` among the matching events."""
+        return int(self._columns(key, [column], where)[column].nunique())
+
+    def page(self, key, offset, limit, order_by=None, descending=False, where=()):
+        """``limit`` matching events from ``offset``, in dataset order or sorted by ``order_by``.
+
+        Only the page's rows are taken from the dataset. Missing values sort last and ties keep
+        dataset order.
+        """
+        if order_by is None:
+            positions = self._matching_positions(key, where)
+        else:
+            positions = self._sorted_positions(key, where, order_by, descending)
+        return self.engine.df.take(positions[offset:offset + limit])
+
+    def row_batches(self, key, limit=None):
+        """The matching events (optionally only the first ``limit``) as DataFrames of at most
+        SCAN_BATCH_ROWS rows; at least one, which may be empty."""
+        positions = self._matching_positions(key)[:limit]
+        for start in range(0, max(len(positions), 1), SCAN_BATCH_ROWS):
+            yield self.engine.df.take(positions[start:start + SCAN_BATCH_ROWS])
+
+
+class ArrowDataset:
+    """Queries over a cached Arrow file that is never loaded as a whole.
+
+    Every query is a streaming Acero plan (scan -> filter -> aggregate) over the memory-mapped
+    file, so memory use is bounded by the batches in flight and the size of the result, not
+    by the dataset. Only aggregated results are converted to pandas.
+    """
+
+    out_of_core = True
+
+    def __init__(self, path):
+        self.path = path
+        self.dataset = ds.dataset(path, format="ipc", filesystem=fs.LocalFileSystem(use_mmap=True))
+        self.columns = self.dataset.schema.names
+        self._timestamp_type = self.dataset.schema.field("timestamp").type
+        self.first_date, self.last_date = self._timestamp_range()
+        self._options = {}
+        # count() results per query, least recently used dropped first. The file never changes,
+        # and the dataset is shared by every session viewing it; the lock guards the LRU.
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()
+
+    def key(self, date_range=None, **selections):
+        return filter_key(self.first_date, self.last_date, date_range, **selections)
+
+    def date_range(self):
+        return self.first_date, self.last_date
+
+    def options(self, column):
+        """Distinct non-missing values of a column, in category order (memoized)."""
+        if column not in self._options:
+            self._options[column] = self.count(self.key(), by=column).index.tolist()
+        return self._options[column]
+
+    def _timestamp_range(self):
+        bounds = self._aggregate(None, ["timestamp"], [("timestamp", "min_max", None, "range")])["range"][0].as_py()
+        if bounds["min"] is None:
+            return None, None
+        return pd.Timestamp(bounds["min"]).date(), pd.Timestamp(bounds["max"]).date()
+
+    def _day_start(self, day):
+        bound = pd.Timestamp(day)
+        if self._timestamp_type.tz is not None:
+            bound = bound.tz_localize(self._timestamp_type.tz)
+        return pa.scalar(bound, type=self._timestamp_type)
+
+    def _expression(self, key, where=()):
+        conditions = []
+        if key.date_range is not None:
+            start_date, end_date = key.date_range
+            timestamps = pc.field("timestamp")
+            conditions += [timestamps >= self._day_start(start_date), timestamps < self._day_start(end_date + timedelta(days=1))]
+        for column, values in key.columns:
+            conditions.append(pc.field(column).isin(list(values)))
+        for column, op, value in where:
+            _check_op(op)
+            if op == "==":
+                conditions.append(pc.field(column) == value)
+            elif op == "!=":
+                conditions.append((pc.field(column) != value) | ~pc.field(column).is_valid())
+            elif op == "contains":
+                conditions.append(pc.match_substring(pc.field(column).cast(pa.string()), value, ignore_case=True))
+            else:
+                conditions.append(pc.field(column).is_valid())
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression &= condition
+        return expression
+
+    def _aggregate(self, expression, columns, aggregates, keys=None):
+        scan_options = {"columns": columns}
+        if expression is not None:
+            # The scan only uses the filter to skip batches; the filter node drops the rows
+            scan_options["filter"] = expression
+        plan = [acero.Declaration("scan", acero.ScanNodeOptions(self.dataset, **scan_options))]
+        if expression is not None:
+            plan.append(acero.Declaration("filter", acero.FilterNodeOptions(expression)))
+        plan.append(acero.Declaration("aggregate", acero.AggregateNodeOptions(aggregates, keys=keys)))
+        return acero.Declaration.from_sequence(plan).to_table(use_threads=True)
+
+    def _referenced_columns(self, key, by, where):
+        columns = list(by)
+        if key.date_range is not None:
+            columns.append("timestamp")
+        columns += [column for column, _ in key.columns]
+        columns += [column for column, _, _ in where]
+        return list(dict.fromkeys(columns))
+
+    def count(self, key, by=None, where=()):
+        """Number of matching events, or a Series of counts per value of ``by`` (a column or list).
+
+        Like a pandas groupby, groups with a missing key are left out and groups come back in
+        sorted (category) order. Results are memoized per query, so repeating one doesn't scan
+        the file again.
+        """
+        query = (key, by if isinstance(by, str) else tuple(by or ()), tuple(where))
+        with self._lock:
+            counts = self._counts.get(query)
+            if counts is not None:
+                self._counts.move_to_end(query)
+        if counts is None:
+            counts = self._count(key, by, where)
+            with self._lock:
+                self._counts[query] = counts
+                while len(self._counts) > OUT_OF_CORE_COUNT_ENTRIES:
+                    self._counts.popitem(last=False)
+        return counts.copy() if isinstance(counts, pd.Series) else counts
+
+    def _count(self, key, by, where):
+        keys = [by] if isinstance(by, str) else list(by or [])
+        expression = self._expression(key, where)
+        columns = self._referenced_columns(key, keys, where) or [self.columns[0]]
+        if not keys:
+            return self._aggregate(expression, columns, [([], "count_all", None, "rows")])["rows"][0].as_py()
+        counts = self._aggregate(expression, columns, [([], "hash_count_all", None, "rows")], keys).to_pandas()
+        counts = counts.dropna(subset=keys).set_index(by)["rows"].sort_index()
+        return counts.rename(None)
+
+    def nunique(self, key, column, where=()):
+        """Number of distinct non-missing values of ``column`` among the matching events."""
+        # Distinct counts have no kernel for dictionary columns; count the groups instead
+        return len(self.count(key, by=column, where=where))
+
+    def page(self, key, offset, limit, order_by=None, descending=False, where=()):
+        """``limit`` matching events from ``offset``, in dataset order or sorted by ``order_by``.
+
+        The scan stops once the page is complete in dataset order; a sorted page is a streaming
+        top-k that keeps only the first ``offset + limit`` rows. Memory use is bounded by the
+        page's position, not by the number of matching events. As in pandas, missing values
+        sort last and ties keep dataset order.
+        """
+        wanted = offset + limit
+        batches = self.dataset.to_batches(filter=self._expression(key, where), batch_size=SCAN_BATCH_ROWS)
+        if order_by is None:
+            kept, skipped, seen = [], 0, 0
+            for batch in batches:
+                if seen + batch.num_rows <= offset:
+                    skipped += batch.num_rows
+                else:
+                    kept.append(batch)
+                seen += batch.num_rows
+                if seen >= wanted:
+                    break
+            table = pa.Table.from_batches(kept, schema=self.dataset.schema).slice(offset - skipped, limit)
+            return table.to_pandas(split_blocks=True)
+
+        sort_keys = [("__sort", "descending" if descending else "ascending"), ("__row", "ascending")]
+        top, missing, missing_rows, seen = None, [], 0, 0
+        for batch in batches:
+            sort_key = self._sort_key(batch.column(order_by), order_by)
+            batch = batch.append_column("__sort", sort_key).append_column("__row", pa.array(np.arange(seen, seen + batch.num_rows)))
+            seen += batch.num_rows
+            present = pc.is_valid(sort_key)
+            # Rows without a sort value go last, in dataset order; select_k would drop them
+            if missing_rows < wanted:
+                absent = batch.filter(pc.invert(present)).slice(0, wanted - missing_rows)
+                missing.append(absent)
+                missing_rows += absent.num_rows
+            candidates = pa.Table.from_batches([batch.filter(present)])
+            if top is not None:
+                candidates = pa.concat_tables([top, candidates])
+            if candidates.num_rows > wanted:
+                candidates = candidates.take(pc.select_k_unstable(candidates, wanted, sort_keys))
+            top = candidates
+        if top is None:
+            return self.dataset.schema.empty_table().to_pandas(split_blocks=True)
+        top = top.take(pc.sort_indices(top, sort_keys))
+        table = pa.concat_tables([top, pa.Table.from_batches(missing, schema=top.schema)]).slice(offset, limit)
+        return table.drop_columns(["__sort", "__row"]).to_pandas(split_blocks=True)
+
+    def row_batches(self, key, limit=None):
+        """The matching events (optionally only the first ``limit``) as DataFrames of at most
+        SCAN_BATCH_ROWS rows; at least one, which may be empty. Rows are numbered across batches."""
+        rows = 0
+        for batch in self.dataset.to_batches(filter=self._expression(key), batch_size=SCAN_BATCH_ROWS):
+            if limit is not None:
+                batch = batch.slice(0, limit - rows)
+            if batch.num_rows:
+                frame = batch.to_pandas()
+                frame.index = pd.RangeIndex(rows, rows + len(frame))
+                rows += len(frame)
+                yield frame
+            if limit is not None and rows >= limit:
+                return
+        if not rows:
+            yield self.dataset.schema.empty_table().to_pandas()
+
+    def _sort_key(self, values, column):
+        if pa.types.is_dictionary(values.type):
+            # Dictionary columns can't be sorted; rank their values in category order, which is
+            # how pandas sorts categoricals
+            return pc.index_in(values, value_set=pa.array(self.options(column), type=values.type.value_type))
+        return values
+
+    def batches(self, columns=None):
+        """The whole dataset as a sequence of DataFrames of at most SCAN_BATCH_ROWS rows."""
+        for batch in self.dataset.to_batches(columns=columns, batch_size=SCAN_BATCH_ROWS):
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+
+def get_query_backend():
+    """Query backend of this session's dataset, or None (with a hint) if nothing is uploaded.
+
+    Datasets in memory are answered by their FilterEngine; datasets too large to load (see
+    OUT_OF_CORE_BYTES) by an ArrowDataset over the cached file. Both answer the same queries.
+    """
+    handle = get_dataset_handle()
+    if handle is None:
+        st.warning("Please upload data on the 'Upload Data' page first.")
+        st.page_link("upload.py", label="Upload Data", icon=":material/upload:")
+        return None
+    if handle.entry.df is None:
+        return handle.entry.dataset
+    return FrameBackend(get_filter_engine())
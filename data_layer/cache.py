@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from pandas.api.types import is_integer_dtype
+
+from data_layer.backend import ArrowDataset
+from data_layer.derived import add_time_columns
+from data_layer.ingest import RESTART
+from data_layer.schema import ID_COLUMNS, combine_chunks
+from data_layer.settings import DATASET_CACHE_DIR, DATASET_CACHE_KEEP, OUT_OF_CORE_BYTES
+from data_layer.store import get_registry
+
+# Bump whenever the canonical dataset changes shape (columns, dtypes, derived columns), so
+# copies written by an older version are parsed again instead of reopened.
+SCHEMA_VERSION = 1
+
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+
+def content_key(source):
+    """Cache key of an uploaded file: a hash of its bytes and the schema version."""
+    digest = hashlib.blake2b(f"schema-{SCHEMA_VERSION}".encode(), digest_size=16)
+    position = source.tell()
+    source.seek(0)
+    for block in iter(lambda: source.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    source.seek(position)
+    return digest.hexdigest()
+
+
+def appended_key(base_key, batch_key):
+    """Cache key of a dataset made by appending an upload (``batch_key``) to dataset ``base_key``."""
+    return hashlib.blake2b(f"{base_key}+{batch_key}".encode(), digest_size=16).hexdigest()
+
+
+def _paths(key):
+    return os.path.join(DATASET_CACHE_DIR, f"{key}.arrow"), os.path.join(DATASET_CACHE_DIR, f"{key}.json")
+
+
+def _fragment_path(key, number):
+    # Fragment 0 is the dataset's main file; appended batches follow (see save_appended_dataset)
+    if number == 0:
+        return _paths(key)[0]
+    return os.path.join(DATASET_CACHE_DIR, f"{key}.{number}.arrow")
+
+
+def _fragment_paths(key):
+    paths = [_fragment_path(key, 0)]
+    while os.path.exists(_fragment_path(key, len(paths))):
+        paths.append(_fragment_path(key, len(paths)))
+    return paths
+
+
+def load_cached_dataset(key):
+    """The prepared dataset cached under ``key``, read from a memory map, or None.
+
+    Datasets larger than OUT_OF_CORE_BYTES, and streamed ones (see ``save_streamed_dataset``),
+    aren't loaded at all: they come back as an ArrowDataset that queries the file in place.
+    Appended datasets (see ``save_appended_dataset``) were in memory when they were made and
+    are always loaded, their fragments concatenated.
+    """
+    data_path, info_path = _paths(key)
+    try:
+        paths = _fragment_paths(key)
+        if len(paths) > 1:
+            data = _concatenate_fragments([_read_fragment(path) for path in paths])
+        elif os.path.getsize(data_path) > OUT_OF_CORE_BYTES or _read_info(info_path).get("streamed"):
+            data = ArrowDataset(data_path)
+        else:
+            data = _read_fragment(data_path)
+    except FileNotFoundError:
+        return None
+    except (pa.ArrowInvalid, OSError):
+        # Truncated or unreadable copy: drop it and parse the upload again
+        _remove(key)
+        return None
+    if os.path.exists(info_path):
+        os.utime(info_path)
+    return data
+
+
+def save_dataset(key, df, name):
+    """Cache a prepared dataset under ``key`` and forget the least recently opened extras."""
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    data_path, info_path = _paths(key)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write next to the final path and rename, so readers never see a half-written file
+    with pa.OSFile(f"{data_path}.tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(f"{data_path}.tmp", data_path)
+    _save_info(key, {"name": name, "rows": len(df)})
+
+
+def save_appended_dataset(key, base_key, df, batch, name):
+    """Cache dataset ``df``, made by appending ``batch`` to the dataset cached under ``base_key``.
+
+    Only the batch is written, as one more fragment after the base's; those are hard links to
+    the base's files, so an append costs the batch's time and disk space, not the dataset's.
+    The fragments are concatenated when the dataset is loaded. If the base isn't cached (e.g. a
+    live dataset, or one evicted meanwhile) or can't be linked, the whole dataset is saved.
+    """
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    base_paths = _fragment_paths(base_key)
+    try:
+        for number, base_path in enumerate(base_paths[1:], start=1):
+            _link(base_path, _fragment_path(key, number))
+        batch_path = _fragment_path(key, len(base_paths))
+        table = pa.Table.from_pandas(batch[list(df.columns)], preserve_index=False)
+        with pa.OSFile(f"{batch_path}.tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{batch_path}.tmp", batch_path)
+        # The main file comes last: until it exists, the dataset isn't there to load
+        _link(base_paths[0], _fragment_path(key, 0))
+    except OSError:
+        _remove(key)
+        save_dataset(key, df, name)
+        return
+    _save_info(key, {"name": name, "rows": len(df)})
+
+
+def _read_fragment(path):
+    # Arrow IPC files are read straight from the mapped pages; nothing is parsed. The file is
+    # closed right away; the mapping itself stays until the frame no longer uses its buffers.
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+def _link(source, path):
+    os.link(source, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def _concatenate_fragments(fragments):
+    # Each fragment is in time order; a batch that overlapped the dataset's time span was
+    # merged into it by timestamp, which a stable sort of the concatenation reproduces
+    df = combine_chunks(fragments)
+    timestamps = df["timestamp"]
+    if not timestamps.is_monotonic_increasing:
+        df = df.take(timestamps.argsort(kind="stable").to_numpy()).reset_index(drop=True)
+    return df
+
+
+def save_streamed_dataset(key, chunks, name):
+    """Cache an upload too large to hold in memory, prepared chunk by chunk as it is read.
+
+    ``chunks`` are normalized chunks as yielded by ``iter_upload``. An Arrow file needs one
+    dictionary per column, so this takes two passes: the chunks are first stored as they come
+    (each in time order, with its calendar columns) while every label is collected, then
+    written again against one shared set of categories per column, chosen as in
+    ``combine_chunks``. Only one chunk is in memory at a time. The result is in time order per
+    chunk only, so it is always reopened out of core. Returns the number of rows saved.
+    """
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    data_path, _ = _paths(key)
+    spill_dir = tempfile.mkdtemp(prefix=f"{key}-", dir=DATASET_CACHE_DIR)
+    try:
+        spilled, categories = [], _StreamedCategories()
+        for chunk in chunks:
+            if chunk is RESTART:
+                spilled, categories = [], _StreamedCategories()
+                continue
+            chunk = chunk.dropna(subset=["timestamp"])
+            if chunk.empty:
+                continue
+            chunk = add_time_columns(chunk.sort_values("timestamp", kind="stable").reset_index(drop=True))
+            categories.add(chunk)
+            path = os.path.join(spill_dir, f"{len(spilled)}.arrow")
+            feather.write_feather(chunk, path, compression="uncompressed")
+            spilled.append(path)
+        if not spilled:
+            raise ValueError("The uploaded file contains no rows.")
+        categories.finish(spilled)
+
+        rows = 0
+        with pa.OSFile(f"{data_path}.tmp", "wb") as sink:
+            writer = None
+            for path in spilled:
+                table = pa.Table.from_pandas(categories.apply(feather.read_feather(path)), preserve_index=False)
+                if writer is None:
+                    writer = pa.ipc.new_file(sink, table.schema)
+                writer.write_table(table)
+                rows += table.num_rows
+                os.remove(path)
+            writer.close()
+        os.replace(f"{data_path}.tmp", data_path)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    _save_info(key, {"name": name, "rows": rows, "streamed": True})
+    return rows
+
+
+class _StreamedCategories:
+    """Categories of every categorical column over all chunks of a streamed upload."""
+
+    def __init__(self):
+        self.labels = {}
+        self.first = {}
+        self.same = {}
+        self.ordered = {}
+        self.integer_ids = {}
+        self.mixed_ids = set()
+        self.shared = {}
+
+    def add(self, chunk):
+        for column, values in chunk.items():
+            integer = is_integer_dtype(values.dtype)
+            if column in ID_COLUMNS:
+                if column in self.integer_ids and self.integer_ids[column] != integer:
+                    # Numeric ids in some chunks and text in others: all become text
+                    self.mixed_ids.add(column)
+                self.integer_ids[column] = self.integer_ids.get(column, True) and integer
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+            self.labels.setdefault(column, set()).update(values.cat.categories)
+            self.first.setdefault(column, values.cat.categories)
+            self.same[column] = self.same.get(column, True) and values.cat.categories.equals(self.first[column])
+            self.ordered[column] = values.cat.ordered
+
+    def finish(self, paths):
+        """Settle the shared categories once all chunks, stored at ``paths``, were added."""
+        for column in self.mixed_ids:
+            # The numeric ids weren't labels when their chunks went by; read them back
+            self.same[column] = False
+            for path in paths:
+                values = feather.read_table(path, columns=[column]).column(0)
+                if pa.types.is_integer(values.type):
+                    self.labels[column].update(values.unique().to_pylist())
+        self.shared = {column: self._categories(column) for column in self.labels}
+
+    def _categories(self, column):
+        if self.ordered[column] and self.same[column]:
+            return self.first[column]
+        labels = self.labels[column]
+        if column in self.mixed_ids:
+            labels = {str(label) for label in labels}
+        try:
+            return pd.Index(sorted(labels), dtype=object)
+        except TypeError:
+            return pd.Index(list(labels), dtype=object)
+
+    def apply(self, chunk):
+        """Cast a stored chunk to the shared categories (and numeric ids to one integer type)."""
+        for column in chunk.columns:
+            if self.integer_ids.get(column):
+                chunk[column] = chunk[column].astype("int64")
+            elif column in self.labels:
+                values = chunk[column]
+                if column in self.mixed_ids:
+                    values = values.astype(object).where(values.isna(), values.astype(str))
+                chunk[column] = pd.Categorical(values, categories=self.shared[column], ordered=self.ordered[column])
+        return chunk
+
+
+def _save_info(key, info):
+    _, info_path = _paths(key)
+    with open(info_path, "w", encoding="utf-8") as info_file:
+        json.dump({**info, "saved_at": time.time()}, info_file)
+    # Out-of-core datasets read their file on every query; the ones in use are kept
+    registry = get_registry()
+    for stale in list_cached_datasets()[DATASET_CACHE_KEEP:]:
+        if registry.forget_file(stale["key"]):
+            _remove(stale["key"])
+
+
+def _read_info(info_path):
+    try:
+        with open(info_path, encoding="utf-8") as info_file:
+            return json.load(info_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def list_cached_datasets():
+    """Cached datasets as dicts (key, name, rows, saved_at, opened_at), most recently opened first."""
+    if not os.path.isdir(DATASET_CACHE_DIR):
+        return []
+    datasets = []
+    for file_name in os.listdir(DATASET_CACHE_DIR):
+        key, extension = os.path.splitext(file_name)
+        data_path, info_path = _paths(key)
+        if extension != ".json" or not os.path.exists(data_path):
+            continue
+        try:
+            with open(info_path, encoding="utf-8") as info_file:
+                info = json.load(info_file)
+        except (OSError, ValueError):
+            continue
+        datasets.append({"key": key, "opened_at": os.path.getmtime(info_path), **info})
+    return sorted(datasets, key=lambda dataset: dataset["opened_at"], reverse=True)
+
+
+def _remove(key):
+    for path in [*_fragment_paths(key), _paths(key)[1]]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
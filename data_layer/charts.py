@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+from data_layer.settings import FIGURE_CACHE_ENTRIES
+from data_layer.store import get_artifact
+
+
+class FigureCache:
+    """Built figures of one dataset, keyed by chart id and the state the chart was built for.
+
+    Least recently used figures are dropped once there are more than ``max_entries``. Cached
+    figures are shared by every session viewing the dataset and must not be modified.
+    """
+
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._figures = OrderedDict()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                return self._figures[key]
+        # Build outside the lock; two sessions racing for the same chart both get a valid figure
+        figure = build()
+        with self._lock:
+            self._figures[key] = figure
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return figure
+
+
+def cached_figure(chart_id, state, build):
+    """The figure ``build()`` makes for chart ``chart_id``, built once per dataset and ``state``.
+
+    ``state`` is any hashable value covering everything the chart depends on besides the dataset
+    (usually the page's FilterKey). A rerun whose state didn't change skips the chart's
+    aggregation and figure construction entirely. ``build`` may return None for "nothing to
+    plot"; that is cached too. A new version of the dataset (append, live data) starts afresh.
+    """
+    return get_artifact("figure_cache", lambda data: FigureCache()).get((chart_id, state), build)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_categorical(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    return values.astype("category")
+
+
+def category_flags(values, predicate):
+    """Evaluate ``predicate`` on the distinct labels of a categorical column and map it back to rows."""
+    values = _as_categorical(values)
+    labels = values.cat.categories.astype(str).to_series()
+    # A trailing False stands for missing values, whose code is -1
+    label_flags = np.append(predicate(labels).to_numpy(dtype=bool), False)
+    return label_flags[values.cat.codes.to_numpy()]
+
+
+def bucket_membership(page_names, keywords_by_bucket):
+    """Classify every distinct page into keyword buckets (e.g. product interest).
+
+    Returns a (n_pages + 1, n_buckets) boolean matrix together with the page code of every
+    row, so ``membership[codes]`` gives the buckets of each event. The last matrix row stands
+    for a missing page name. Each label is lowered and matched once, however many events
+    point at it.
+    """
+    page_names = _as_categorical(page_names)
+    labels = page_names.cat.categories.astype(str).str.lower()
+    membership = np.zeros((len(labels) + 1, len(keywords_by_bucket)), dtype=bool)
+    for column, keywords in enumerate(keywords_by_bucket.values()):
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        for keyword in keywords:
+            membership[:-1, column] |= np.asarray(labels.str.contains(keyword.lower(), regex=False), dtype=bool)
+    return membership, page_names.cat.codes.to_numpy()
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _period_categorical(keys, make_label):
+    # Integer period keys -> ordered categorical; only the distinct periods are ever formatted
+    keys = np.asarray(keys)
+    periods, codes = np.unique(keys, return_inverse=True)
+    labels = [make_label(int(period)) for period in periods]
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+
+def add_time_columns(df):
+    """Add the calendar columns every page filters and groups on, computed once per upload.
+
+    date        day the event happened (datetime64, midnight)
+    month       "2025-01" style labels, ordered categorical
+    quarter     "2025Q1" style labels, ordered categorical
+    year, hour  small integers
+    day_of_week "Monday".."Sunday", ordered categorical
+    """
+    timestamps = df["timestamp"]
+    year = timestamps.dt.year.to_numpy()
+    month_of_year = timestamps.dt.month.to_numpy()
+
+    df["date"] = timestamps.dt.normalize()
+    df["month"] = _period_categorical(year * 12 + month_of_year - 1, lambda key: f"{key // 12:04d}-{key % 12 + 1:02d}")
+    df["year"] = year.astype("int16")
+    df["hour"] = timestamps.dt.hour.astype("int8")
+    df["quarter"] = _period_categorical(year * 4 + (month_of_year - 1) // 3, lambda key: f"{key // 4}Q{key % 4 + 1}")
+    df["day_of_week"] = pd.Categorical.from_codes(timestamps.dt.dayofweek.to_numpy(), categories=DAY_NAMES, ordered=True)
+    return df
+
+
+def prepare_dataset(df):
+    """Turn a freshly ingested frame into the canonical dataset the pages read."""
+    if "timestamp" not in df.columns:
+        raise KeyError("timestamp")
+    if not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+
+    # Rows without a usable timestamp can't be placed on any chart or filter. The rest are
+    # kept in time order so date ranges can be answered by binary search (see filters.py).
+    df = df.dropna(subset=["timestamp"])
+    if not df["timestamp"].is_monotonic_increasing:
+        df = df.sort_values("timestamp", kind="stable")
+    return add_time_columns(df.reset_index(drop=True))
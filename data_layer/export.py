@@ -0,0 +1,120 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_layer.settings import EXPORT_CACHE_BYTES
+from data_layer.store import get_artifact
+
+# Export formats by id: label, file extension and MIME type
+EXPORT_FORMATS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", "csv.gz", "application/gzip"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+
+
+def write_export(batches, path, export_format):
+    """Write a sequence of DataFrames to ``path`` as one file, one batch at a time.
+
+    Only one batch is encoded at a time, so memory use doesn't grow with the export.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format!r}; expected one of {', '.join(EXPORT_FORMATS)}.")
+    if export_format == "parquet":
+        writer = None
+        try:
+            for batch in batches:
+                table = pa.Table.from_pandas(batch, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+    # CSV keeps the row labels, as DataFrame.to_csv does
+    opener = gzip.open if export_format == "csv.gz" else open
+    with opener(path, "wt", encoding="utf-8", newline="") as out:
+        for number, batch in enumerate(batches):
+            batch.to_csv(out, header=number == 0)
+
+
+class ExportCache:
+    """Export files of one dataset, keyed by format and filter state, in a private temporary directory.
+
+    Files are kept until together they take more than ``max_bytes``; then the least recently
+    used are deleted (never the newest). The directory goes away with the cache, e.g. when a
+    newer version of the dataset replaces it.
+    """
+
+    def __init__(self, max_bytes=EXPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = tempfile.mkdtemp(prefix="dashboard-export-")
+        weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self._total_bytes = 0
+
+    def read(self, key):
+        """Contents of the file cached under ``key``, or None."""
+        with self._lock:
+            path = self._files.get(key)
+            if path is None:
+                return None
+            self._files.move_to_end(key)
+        try:
+            with open(path, "rb") as export_file:
+                return export_file.read()
+        except FileNotFoundError:
+            # Evicted by another session in the meantime
+            return None
+
+    def get(self, key, write):
+        """Contents of the file cached under ``key``, written with ``write(path)`` first if there is none."""
+        data = self.read(key)
+        if data is not None:
+            return data
+        # Write outside the lock; two sessions racing for the same export both get a valid file
+        handle, path = tempfile.mkstemp(dir=self.directory)
+        os.close(handle)
+        try:
+            write(path)
+            with open(path, "rb") as export_file:
+                data = export_file.read()
+        except BaseException:
+            os.remove(path)
+            raise
+        with self._lock:
+            if key in self._files:
+                os.remove(path)
+                return data
+            self._files[key] = path
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._files) > 1:
+                _, evicted = self._files.popitem(last=False)
+                self._total_bytes -= os.path.getsize(evicted)
+                os.remove(evicted)
+        return data
+
+
+def _export_cache():
+    return get_artifact("export_cache", lambda data: ExportCache())
+
+
+def export_events(backend, key, export_format, limit=None):
+    """Export of the events matching FilterKey ``key`` (optionally only the first ``limit``) as bytes.
+
+    The file is streamed from the query backend to disk a batch at a time on the first request
+    and cached per dataset; later requests for the same selection and format only read it.
+    """
+    return _export_cache().get(
+        (export_format, key, limit),
+        lambda path: write_export(backend.row_batches(key, limit), path, export_format),
+    )
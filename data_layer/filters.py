@@ -0,0 +1,262 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from data_layer.indexes import build_column_indexes
+from data_layer.settings import FILTER_CACHE_BYTES
+from data_layer.store import get_artifact
+
+
+def _day_start(day, timestamps):
+    bound = pd.Timestamp(day)
+    if timestamps.dt.tz is not None:
+        bound = bound.tz_localize(timestamps.dt.tz)
+    return bound
+
+
+def sorted_range_bounds(timestamps, start_date, end_date):
+    """Positions [start, stop) of the values of a sorted datetime Series between two dates, both inclusive."""
+    start = timestamps.searchsorted(_day_start(start_date, timestamps), side="left")
+    stop = timestamps.searchsorted(_day_start(end_date + timedelta(days=1), timestamps), side="left")
+    return int(start), int(stop)
+
+
+def date_range_bounds(df, start_date, end_date):
+    """Row positions [start, stop) of the events between two dates, both inclusive.
+
+    Relies on the canonical frame being sorted by 'timestamp' (see prepare_dataset), so
+    each bound is a binary search rather than a comparison against every row.
+    """
+    return sorted_range_bounds(df["timestamp"], start_date, end_date)
+
+
+def available_date_range(df):
+    """First and last event date in the (sorted) dataset."""
+    timestamps = df["timestamp"]
+    return timestamps.iloc[0].date(), timestamps.iloc[-1].date()
+
+
+class FilterKey(NamedTuple):
+    """Hashable, order-insensitive form of a sidebar filter state."""
+
+    date_range: tuple | None
+    columns: tuple
+
+
+def filter_key(first_date, last_date, date_range=None, **selections):
+    """FilterKey of a sidebar state, for a dataset spanning ``first_date``..``last_date``.
+
+    Empty selections are dropped, and a range covering the whole dataset is no filter at all.
+    """
+    if date_range is not None and first_date is not None:
+        start_date, end_date = date_range
+        if start_date <= first_date and end_date >= last_date:
+            date_range = None
+        else:
+            date_range = (start_date, end_date)
+    columns = tuple(sorted((column, frozenset(values)) for column, values in selections.items() if values))
+    return FilterKey(date_range, columns)
+
+
+class _Selection:
+    """Rows of one filter state, stored as compactly as the state allows.
+
+    A date-only state is a contiguous slice. Otherwise the matching rows inside the date
+    range are kept either as a packed bitmap or as an array of row positions, whichever
+    is smaller.
+    """
+
+    def __init__(self, start, stop, mask=None):
+        self.start, self.stop = start, stop
+        self.bits = self.positions = None
+        self.count = stop - start
+        if mask is not None:
+            self.count = int(np.count_nonzero(mask))
+            position_dtype = np.int32 if stop < 2**31 else np.int64
+            if self.count * np.dtype(position_dtype).itemsize < len(mask) / 8:
+                self.positions = (np.flatnonzero(mask) + start).astype(position_dtype)
+            else:
+                self.bits = np.packbits(mask)
+
+    @property
+    def nbytes(self):
+        if self.positions is not None:
+            return self.positions.nbytes
+        return 0 if self.bits is None else self.bits.nbytes
+
+    def rows(self):
+        """A slice or an array of row positions."""
+        if self.positions is not None:
+            return self.positions
+        if self.bits is not None:
+            return np.flatnonzero(np.unpackbits(self.bits, count=self.stop - self.start)) + self.start
+        return slice(self.start, self.stop)
+
+
+def _isin_mask(values, wanted):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Compare small integer codes against a lookup table instead of comparing labels
+        lookup = np.zeros(len(values.cat.categories) + 1, dtype=bool)
+        lookup[:-1] = values.cat.categories.isin(list(wanted))
+        return lookup[values.cat.codes.to_numpy()]
+    return values.isin(list(wanted)).to_numpy()
+
+
+def _narrows(key, base_key):
+    """Whether every row matching ``key`` also matches ``base_key`` (same dates or fewer,
+    and each of the base's column constraints kept or tightened)."""
+    if base_key.date_range is not None:
+        if key.date_range is None:
+            return False
+        if key.date_range[0] < base_key.date_range[0] or key.date_range[1] > base_key.date_range[1]:
+            return False
+    columns = dict(key.columns)
+    return all(column in columns and columns[column] <= wanted for column, wanted in base_key.columns)
+
+
+class FilterEngine:
+    """Resolves sidebar filter states of one dataset to row selections and memoizes them.
+
+    Selections are cached per normalized filter state in an LRU bounded by ``max_bytes``, so
+    flipping back to a previous state (or another page with the same filters) is a lookup.
+    A state that narrows a cached one (a new filter, fewer values, a shorter range) is
+    refined from that selection instead of rescanning the dataset.
+    """
+
+    def __init__(self, df, max_bytes=FILTER_CACHE_BYTES, indexes=None):
+        self.df = df
+        self.max_bytes = max_bytes
+        self.first_date, self.last_date = available_date_range(df) if len(df) else (None, None)
+        self.indexes = build_column_indexes(df) if indexes is None else indexes
+        # Engines are shared by every session viewing the dataset; the lock guards the LRU
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._options = {}
+
+    def options(self, column):
+        """Distinct non-missing values of a column, in order of first appearance (memoized)."""
+        if column not in self._options:
+            self._options[column] = self.df[column].dropna().unique().tolist()
+        return self._options[column]
+
+    def key(self, date_range=None, **selections):
+        return filter_key(self.first_date, self.last_date, date_range, **selections)
+
+    def select(self, key):
+        """Row selection (slice or positions) for a FilterKey."""
+        with self._lock:
+            selection = self._cache.get(key)
+            if selection is not None:
+                self._cache.move_to_end(key)
+                return selection.rows()
+        selection = self._evaluate(key)
+        with self._lock:
+            self._remember(key, selection)
+        return selection.rows()
+
+    def _evaluate(self, key):
+        start, stop = 0, len(self.df)
+        if key.date_range is not None:
+            start, stop = date_range_bounds(self.df, *key.date_range)
+        if not key.columns:
+            return _Selection(start, stop)
+        base_key, base = self._narrowest_cached(key, start, stop)
+        if base is not None:
+            return self._refine(key, start, stop, base_key, base)
+        indexed = [(column, wanted) for column, wanted in key.columns if column in self.indexes]
+        if not indexed:
+            mask = None
+            for column, wanted in key.columns:
+                column_mask = _isin_mask(self.df[column].iloc[start:stop], wanted)
+                mask = column_mask if mask is None else mask & column_mask
+            return _Selection(start, stop, mask)
+        # OR within a column is a merge of its row-id lists; AND across columns starts from
+        # the shortest list and probes the others only for those rows
+        candidates = [self.indexes[column].rows(wanted, start, stop) for column, wanted in indexed]
+        shortest = min(range(len(candidates)), key=lambda i: len(candidates[i]))
+        positions = candidates[shortest]
+        for column, wanted in key.columns:
+            if column != indexed[shortest][0]:
+                positions = positions[_isin_mask(self.df[column].take(positions), wanted)]
+        return self._from_positions(start, stop, positions)
+
+    def _narrowest_cached(self, key, start, stop):
+        # The smallest cached selection that the new state narrows, if any
+        best_key = best = None
+        with self._lock:
+            cached_items = list(self._cache.items())
+        for cached_key, cached in cached_items:
+            # A date-only selection is a slice; scanning it directly is as cheap as refining
+            if not cached_key.columns or cached.start > start or cached.stop < stop:
+                continue
+            if not _narrows(key, cached_key):
+                continue
+            if best is None or cached.count < best.count:
+                best_key, best = cached_key, cached
+        return best_key, best
+
+    def _refine(self, key, start, stop, base_key, base):
+        # Only the rows already selected by the cached state are re-checked, and only
+        # against the column constraints that changed
+        rows = base.rows()
+        if isinstance(rows, slice):
+            positions = np.arange(start, stop)
+        else:
+            positions = rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+        base_columns = dict(base_key.columns)
+        for column, wanted in key.columns:
+            if base_columns.get(column) == wanted:
+                continue
+            positions = positions[_isin_mask(self.df[column].take(positions), wanted)]
+        return self._from_positions(start, stop, positions)
+
+    @staticmethod
+    def _from_positions(start, stop, positions):
+        mask = np.zeros(stop - start, dtype=bool)
+        mask[positions - start] = True
+        return _Selection(start, stop, mask)
+
+    def merge(self, df, other, positions, other_positions):
+        """Engine of ``df``, the merge of this engine's dataset and ``other``'s (e.g. an appended batch).
+
+        ``positions`` and ``other_positions`` give the row in ``df`` of every row of the two
+        datasets. Indexes, options and cached selections are carried over: each cached state is
+        only evaluated against the other (small) dataset, never against this one again.
+        """
+        indexes = {
+            column: index.merge(other.indexes[column], df[column].cat.categories, positions, other_positions)
+            for column, index in self.indexes.items()
+            if column in other.indexes
+        }
+        merged = FilterEngine(df, self.max_bytes, indexes)
+        for column, options in self._options.items():
+            known = set(options)
+            merged._options[column] = options + [value for value in other.options(column) if value not in known]
+        with self._lock:
+            cached_items = list(self._cache.items())
+        for key, selection in cached_items:
+            rows = np.sort(np.concatenate([positions[selection.rows()], other_positions[other.select(key)]]))
+            start, stop = 0, len(df)
+            if key.date_range is not None:
+                start, stop = date_range_bounds(df, *key.date_range)
+            merged._remember(key, self._from_positions(start, stop, rows) if key.columns else _Selection(start, stop))
+        return merged
+
+    def _remember(self, key, selection):
+        if key in self._cache or selection.nbytes > self.max_bytes:
+            return
+        self._cache[key] = selection
+        self._cached_bytes += selection.nbytes
+        while self._cached_bytes > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+
+
+def get_filter_engine():
+    """Filter engine of the current dataset, shared by all pages."""
+    return get_artifact("filter_engine", FilterEngine)
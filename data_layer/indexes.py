@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Dimensions the sidebars filter on
+INDEXED_COLUMNS = ["country", "processed_by", "purchased_product", "quarter", "product_category"]
+
+
+def sorted_merge_positions(left, right):
+    """Where the items of two sorted arrays land when merged stably (left items first on ties)."""
+    right_positions = np.searchsorted(left, right, side="right") + np.arange(len(right))
+    is_right = np.zeros(len(left) + len(right), dtype=bool)
+    is_right[right_positions] = True
+    return np.flatnonzero(~is_right), right_positions
+
+
+class ColumnIndex:
+    """Sorted row-id lists of one categorical column, one list per category.
+
+    The lists are slices of a single stable argsort of the category codes, so each is in row
+    (and therefore time) order and a date range narrows it with two binary searches.
+    """
+
+    def __init__(self, categories, row_ids, offsets):
+        self.categories = categories
+        self.row_ids = row_ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_column(cls, values):
+        codes = values.cat.codes.to_numpy()
+        row_dtype = np.int32 if len(codes) < 2**31 else np.int64
+        row_ids = np.argsort(codes, kind="stable").astype(row_dtype)
+        # Missing values (code -1) sort first and get their own leading list
+        counts = np.bincount(codes.astype(np.int64) + 1, minlength=len(values.cat.categories) + 1)
+        return cls(values.cat.categories, row_ids, np.concatenate([[0], np.cumsum(counts)]))
+
+    @property
+    def nbytes(self):
+        return self.row_ids.nbytes + self.offsets.nbytes
+
+    def rows(self, wanted, start, stop):
+        """Sorted positions in ``[start, stop)`` whose value is one of ``wanted``."""
+        codes = self.categories.get_indexer(list(wanted))
+        parts = []
+        for code in np.unique(codes[codes >= 0]) + 1:
+            ids = self.row_ids[self.offsets[code]:self.offsets[code + 1]]
+            parts.append(ids[np.searchsorted(ids, start):np.searchsorted(ids, stop)])
+        if not parts:
+            return np.empty(0, dtype=self.row_ids.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+    def _merge_keys(self, categories, positions, n_rows):
+        # (list, row) pairs as one sortable key, with lists and rows numbered as in the merge
+        lists = np.append(0, categories.get_indexer(self.categories) + 1)
+        list_of_item = np.repeat(lists, np.diff(self.offsets))
+        keys = list_of_item * n_rows + positions[self.row_ids]
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            # Only when the categories themselves couldn't be sorted
+            keys = np.sort(keys)
+        return keys
+
+    def merge(self, other, categories, positions, other_positions):
+        """Index of two datasets merged into one.
+
+        ``categories`` are the merged column's categories; ``positions`` and ``other_positions``
+        give the merged row of every row of this index's and the other index's dataset.
+        """
+        n_rows = len(positions) + len(other_positions)
+        keys = self._merge_keys(categories, positions, n_rows)
+        other_keys = other._merge_keys(categories, other_positions, n_rows)
+        merged = np.empty(n_rows, dtype=np.int64)
+        into_keys, into_other = sorted_merge_positions(keys, other_keys)
+        merged[into_keys], merged[into_other] = keys, other_keys
+        counts = np.bincount(merged // n_rows, minlength=len(categories) + 1)
+        row_dtype = np.int32 if n_rows < 2**31 else np.int64
+        return ColumnIndex(categories, (merged % n_rows).astype(row_dtype), np.concatenate([[0], np.cumsum(counts)]))
+
+
+def build_column_indexes(df, columns=INDEXED_COLUMNS):
+    """Row-id indexes for the categorical filter dimensions present in ``df``."""
+    return {
+        column: ColumnIndex.from_column(df[column])
+        for column in columns
+        if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
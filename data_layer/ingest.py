@@ -0,0 +1,237 @@
+import gzip
+import zlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from data_layer.schema import CATEGORICAL_COLUMNS, ID_COLUMNS, combine_chunks, normalize_chunk
+from data_layer.settings import CSV_CHUNK_ROWS, CSV_ENGINE
+
+# File types the upload page accepts, matched against the end of the file name
+UPLOAD_TYPES = ["csv", "csv.gz", "csv.zst", "parquet", "arrow", "feather", "ipc", "ndjson", "jsonl"]
+
+# Columns the dashboard reads; columnar uploads only load these
+DASHBOARD_COLUMNS = ["timestamp", *ID_COLUMNS, *CATEGORICAL_COLUMNS]
+
+# CSV bytes the Arrow reader parses per block (one record batch). Only the blocks in flight are
+# held as Arrow data, so parsing memory doesn't grow with the file; Arrow reads up to 32 blocks
+# ahead of the parser, which makes this block size about 128 MB of read-ahead.
+ARROW_CSV_BLOCK_BYTES = 4 * 1024 * 1024
+
+# Decompressed bytes read from the start of a compressed upload to estimate its full size
+SIZE_SAMPLE_BYTES = 16 * 1024 * 1024
+
+# Yielded by a chunk iterator instead of a chunk when reading starts over from the top (Arrow hit
+# a row it can't parse part-way through the file); the chunks yielded before it are void.
+RESTART = None
+
+
+def _parse_timestamps(chunk):
+    if "timestamp" in chunk.columns:
+        # Columnar files may carry second or millisecond timestamps; keep one unit across chunks
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], errors="coerce").dt.as_unit("ns")
+    return normalize_chunk(chunk)
+
+
+def iter_csv_chunks(source, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield the CSV in DataFrames of at most ``chunk_rows`` rows, with 'timestamp' parsed."""
+    with pd.read_csv(source, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _parse_timestamps(chunk)
+
+
+def _open_arrow_csv(source):
+    # Arrow streams the file a block at a time, parsing ahead on all cores. The label columns
+    # come back dictionary-encoded (categoricals); timestamps are parsed per batch, see below.
+    column_types = {"timestamp": pa.string()}
+    column_types.update({column: pa.dictionary(pa.int32(), pa.string()) for column in CATEGORICAL_COLUMNS})
+    return pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=ARROW_CSV_BLOCK_BYTES),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+
+
+def _with_timestamps(batch):
+    # ISO timestamps are parsed by Arrow; a batch with a value it rejects keeps its strings,
+    # which pandas then parses, turning the bad values into NaT
+    position = batch.schema.get_field_index("timestamp")
+    if position < 0:
+        return batch
+    try:
+        timestamps = batch.column(position).cast(pa.timestamp("ns"))
+    except pa.ArrowInvalid:
+        return batch
+    return batch.set_column(position, "timestamp", timestamps)
+
+
+def iter_table_chunks(table, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield an Arrow table (or record batch) as canonical DataFrames of at most ``chunk_rows`` rows."""
+    for offset in range(0, table.num_rows, chunk_rows):
+        yield _parse_timestamps(table.slice(offset, chunk_rows).to_pandas())
+
+
+def _csv_chunks(source, file_name, chunk_rows, engine):
+    if engine == "arrow":
+        try:
+            for batch in _open_arrow_csv(_open_compressed(source, file_name)):
+                yield from iter_table_chunks(_with_timestamps(batch), chunk_rows)
+            return
+        except pa.ArrowInvalid:
+            # A malformed row (or an id column typed differently further down): pandas reads
+            # the file again from the top
+            source.seek(0)
+            yield RESTART
+    yield from iter_csv_chunks(_open_compressed(source, file_name), chunk_rows)
+
+
+def iter_ndjson_chunks(source, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield newline-delimited JSON records in DataFrames of at most ``chunk_rows`` rows."""
+    with pd.read_json(source, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False) as reader:
+        for chunk in reader:
+            yield _parse_timestamps(chunk)
+
+
+def _projected(names):
+    return [name for name in names if name in DASHBOARD_COLUMNS]
+
+
+def iter_parquet_chunks(source, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield a Parquet file batch by batch, reading only the dashboard's columns."""
+    parquet_file = pq.ParquetFile(source)
+    columns = _projected(parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield _parse_timestamps(batch.to_pandas())
+
+
+def iter_arrow_chunks(source, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield an Arrow IPC file (Feather v2) or stream record batch by record batch."""
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the random-access file format; try the streaming one from the top
+        source.seek(0)
+        batches = pa.ipc.open_stream(source)
+    for batch in batches:
+        batch = batch.select(_projected(batch.schema.names))
+        yield from iter_table_chunks(batch, chunk_rows)
+
+
+class _KeepOpen:
+    """The upload, minus close(): Arrow streams close the file they wrap, but a failed parse
+    still has to rewind the upload for the pandas fallback (and progress reads its position)."""
+
+    def __init__(self, source):
+        self._source = source
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
+
+    @property
+    def closed(self):
+        return self._source.closed
+
+    def close(self):
+        pass
+
+
+def _open_compressed(source, file_name):
+    # Decompress on the fly; the parser pulls blocks from the compressed upload as it goes
+    if file_name.endswith(".gz"):
+        return gzip.open(source)
+    if file_name.endswith(".zst"):
+        return pa.CompressedInputStream(pa.PythonFile(_KeepOpen(source), mode="r"), "zstd")
+    return source
+
+
+def _fraction_read(source, total_bytes):
+    # The C parser reads ahead in blocks, so the file position is a close (not exact) measure
+    try:
+        return min(source.tell() / total_bytes, 1.0)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def expanded_size(source, file_name):
+    """Estimated size in bytes of an upload once decompressed.
+
+    Compressed CSV is decompressed for its first SIZE_SAMPLE_BYTES and assumed to expand at the
+    same ratio throughout; Parquet reports its uncompressed size itself. Anything else (or a
+    file that can't be read) counts at its own size.
+    """
+    file_name = file_name.lower()
+    position = source.tell()
+    try:
+        if file_name.endswith(".parquet"):
+            metadata = pq.ParquetFile(source).metadata
+            return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+        if file_name.endswith((".gz", ".zst")):
+            source.seek(0)
+            sample = _open_compressed(source, file_name).read(SIZE_SAMPLE_BYTES)
+            if len(sample) < SIZE_SAMPLE_BYTES:
+                # Decompressed to the end
+                return len(sample)
+            return int(source.size * len(sample) / max(source.tell(), 1))
+    except (OSError, EOFError, zlib.error, pa.ArrowInvalid):
+        pass
+    finally:
+        source.seek(position)
+    return source.size
+
+
+def iter_upload(source, file_name, chunk_rows=CSV_CHUNK_ROWS, on_progress=None, engine=CSV_ENGINE):
+    """Yield an uploaded file of any of the UPLOAD_TYPES, chosen by its name, as normalized chunks.
+
+    CSV (plain, gzip or zstd) and NDJSON are parsed chunk by chunk, compressed CSV while it is
+    being decompressed; Parquet and Arrow are read batch by batch. Only one chunk at a time is
+    ever held as Python strings. May yield RESTART (see above).
+
+    ``on_progress(fraction, rows_read)`` is called after every chunk; ``fraction`` is measured
+    on the (compressed) upload and is None when its size is unknown. ``engine="arrow"`` parses
+    CSV with Arrow's multi-threaded reader, falling back to pandas when Arrow rejects the file.
+    """
+    file_name = file_name.lower()
+    if file_name.endswith(".parquet"):
+        chunks = iter_parquet_chunks(source, chunk_rows)
+    elif file_name.endswith((".arrow", ".feather", ".ipc")):
+        chunks = iter_arrow_chunks(source, chunk_rows)
+    elif file_name.endswith((".ndjson", ".jsonl")):
+        chunks = iter_ndjson_chunks(source, chunk_rows)
+    else:
+        chunks = _csv_chunks(source, file_name, chunk_rows, engine)
+    return _with_progress(chunks, source, on_progress)
+
+
+def read_upload(source, file_name, chunk_rows=CSV_CHUNK_ROWS, on_progress=None, engine=CSV_ENGINE):
+    """Read an uploaded file of any of the UPLOAD_TYPES into one DataFrame; see ``iter_upload``."""
+    return _combined(iter_upload(source, file_name, chunk_rows, on_progress, engine))
+
+
+def _with_progress(chunk_iter, source, on_progress):
+    total_bytes = getattr(source, "size", None)
+    rows_read = 0
+    for chunk in chunk_iter:
+        if chunk is RESTART:
+            rows_read = 0
+        else:
+            rows_read += len(chunk)
+            if on_progress is not None:
+                fraction = _fraction_read(source, total_bytes) if total_bytes else None
+                on_progress(fraction, rows_read)
+        yield chunk
+
+
+def _combined(chunk_iter):
+    chunks = []
+    for chunk in chunk_iter:
+        if chunk is RESTART:
+            chunks = []
+        else:
+            chunks.append(chunk)
+
+    if not chunks:
+        raise ValueError("The uploaded file contains no rows.")
+    return combine_chunks(chunks)
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from data_layer.append import append_new_events, drop_known_events
+from data_layer.derived import prepare_dataset
+from data_layer.ingest import UPLOAD_TYPES, read_upload
+from data_layer.settings import LIVE_REFRESH_SECONDS, LIVE_SETTLE_SECONDS
+from data_layer.store import get_dataset_handle, get_registry
+
+logger = logging.getLogger(__name__)
+
+# Registry keys of live datasets start with this; uploads are keyed by content hash
+LIVE_KEY_PREFIX = "live:"
+
+
+def _is_log_file(path):
+    return os.path.isfile(path) and path.lower().endswith(tuple(f".{file_type}" for file_type in UPLOAD_TYPES))
+
+
+def _modified_at(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        # Removed since the directory was listed; queue() skips it
+        return 0
+
+
+class _DirectoryEvents(FileSystemEventHandler):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.ingest.queue(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.ingest.queue(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.ingest.queue(event.dest_path)
+
+
+class LiveIngest:
+    """Appends log files dropped into a directory to one shared, growing dataset.
+
+    A watchdog observer queues new and changed files; a worker thread waits until a file has
+    settled, reads it, and appends its new events to the dataset registered under ``key``,
+    updating the dataset's rollups and indexes in place of rebuilding them. Files already in
+    the directory are ingested at start, oldest first.
+
+    Raises OSError when ``directory`` can't be listed or watched (missing, not a directory,
+    no permission).
+    """
+
+    def __init__(self, directory, registry, settle_seconds=LIVE_SETTLE_SECONDS):
+        self.directory = os.path.abspath(directory)
+        self.key = LIVE_KEY_PREFIX + self.directory
+        self.registry = registry
+        self.settle_seconds = settle_seconds
+        self.handle = None
+        self.files_ingested = 0
+        self.last_error = None
+        self._ingested = {}
+        self._pending = {}
+        self._condition = threading.Condition()
+
+        for path in sorted((os.path.join(self.directory, name) for name in os.listdir(self.directory)), key=_modified_at):
+            self.queue(path)
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._observer.schedule(_DirectoryEvents(self), self.directory, recursive=False)
+        self._observer.start()
+        threading.Thread(target=self._run, name="live-ingest", daemon=True).start()
+
+    @property
+    def available(self):
+        return self.handle is not None
+
+    def queue(self, path):
+        if not _is_log_file(path):
+            return
+        with self._condition:
+            # Every event restarts the file's settle timer, so half-written exports are skipped
+            self._pending[path] = time.monotonic()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(timeout=self.settle_seconds)
+                now = time.monotonic()
+                ready = sorted(path for path, queued_at in self._pending.items() if now - queued_at >= self.settle_seconds)
+                for path in ready:
+                    del self._pending[path]
+            for path in ready:
+                try:
+                    self._ingest(path)
+                except Exception as e:
+                    logger.exception("Live ingestion of %s failed", path)
+                    self.last_error = f"{os.path.basename(path)}: {e}"
+
+    def _ingest(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._ingested.get(path) == signature:
+            return
+        with open(path, "rb") as source:
+            batch = prepare_dataset(read_upload(source, os.path.basename(path)))
+        self._ingested[path] = signature
+
+        if self.handle is None:
+            if len(batch):
+                # The ingester keeps its own handle, so the live dataset is never evicted
+                self.handle = self.registry.acquire(self.key, lambda: batch)
+        else:
+            entry = self.handle.entry
+            # A rewritten file only contributes the events it didn't have before
+            batch = drop_known_events(entry.df, batch)
+            if len(batch):
+                merged, artifacts = append_new_events(entry.df, dict(entry.artifacts), batch)
+                self.registry.replace(entry, merged, artifacts)
+        self.files_ingested += 1
+        self.last_error = None
+
+
+@st.cache_resource
+def get_live_ingest(directory):
+    """The process-wide ingester for ``directory``, started on first use.
+
+    Raises OSError when the directory can't be watched; nothing is cached then, so a later
+    call tries again (e.g. once the directory exists).
+    """
+    return LiveIngest(directory, get_registry())
+
+
+def refresh_when_updated(interval=LIVE_REFRESH_SECONDS):
+    """Rerun the page when the live dataset it shows has grown; a no-op for uploaded datasets."""
+    handle = get_dataset_handle()
+    if handle is None or not handle.key.startswith(LIVE_KEY_PREFIX):
+        return
+    seen_version = handle.entry.version
+
+    @st.fragment(run_every=interval)
+    def check_for_new_data():
+        if handle.entry.version != seen_version:
+            st.rerun()
+
+    check_for_new_data()
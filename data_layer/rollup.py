@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.classify import bucket_membership, category_flags
+from data_layer.filters import sorted_range_bounds
+from data_layer.schema import combine_chunks
+from data_layer.settings import APPROXIMATE_DISTINCT_ERROR, DEMO_PAGE_KEYWORD, DEMO_REQUEST_PAGE, PRODUCT_INTEREST_KEYWORDS
+from data_layer.sketches import DistinctSet, HyperLogLog
+from data_layer.store import get_artifact
+
+# One rollup cell per day x country x referrer x product x salesperson. 'month' is carried
+# along (it is a function of the day) so monthly charts don't need to re-derive it.
+DIMENSIONS = ["date", "month", "country", "referrer", "purchased_product", "processed_by"]
+# 'purchases' counts every event that isn't "No Purchase" (as the KPI card always has);
+# 'named_purchases' only those naming a product, which is what the per-group charts count.
+MEASURES = ["events", "purchases", "named_purchases", "demo_views", "demo_requests"]
+
+
+def select_cells(cells, start_date=None, end_date=None, countries=None):
+    """Boolean mask over date-ordered cells matching a date range and country selection."""
+    mask = np.ones(len(cells), dtype=bool)
+    if start_date is not None and end_date is not None:
+        # Cells are ordered by date, so the range is a slice
+        start, stop = sorted_range_bounds(cells["date"], start_date, end_date)
+        mask[:start] = False
+        mask[stop:] = False
+    if countries:
+        mask &= cells["country"].isin(countries).to_numpy()
+    return mask
+
+
+class CellTable:
+    """Base of the upload-time tables kept as date-ordered ``cells`` with a 'country' column."""
+
+    def select(self, start_date=None, end_date=None, countries=None):
+        """Boolean mask over the cells matching a date range and country selection."""
+        return select_cells(self.cells, start_date, end_date, countries)
+
+
+def _distinct(cells, values, row_mask=None, relative_error=None):
+    if relative_error is None:
+        return DistinctSet.from_column(cells, values, row_mask)
+    return HyperLogLog.from_column(cells, values, row_mask, relative_error=relative_error)
+
+
+class DailyRollup(CellTable):
+    """Counts and distinct-value sketches per rollup cell, for KPIs and time series over any filter.
+
+    The sketches are exact DistinctSets, or HyperLogLogs for an approximate rollup. Product
+    interest is kept per (cell, bucket): ``interest_visitors`` is keyed by
+    ``cell * len(interest_buckets) + bucket``.
+    """
+
+    def __init__(self, cells, sessions, interest_buckets, interest_visitors):
+        self.cells = cells
+        self.sessions = sessions
+        self.interest_buckets = interest_buckets
+        self.interest_visitors = interest_visitors
+
+    @property
+    def approximate(self):
+        return self.sessions.approximate
+
+    def totals(self, mask):
+        totals = {measure: int(self.cells[measure].to_numpy()[mask].sum()) for measure in MEASURES}
+        totals["sessions"] = self.sessions.count(mask)
+        return totals
+
+    def daily_sessions(self, mask):
+        """Distinct sessions per day."""
+        days, day_of_cell = np.unique(self.cells["date"].to_numpy(), return_inverse=True)
+        counts = self.sessions.count_by(mask, day_of_cell, len(days))
+        present = np.bincount(day_of_cell[mask], minlength=len(days)) > 0
+        return pd.Series(counts[present], index=pd.Index(days[present], name="date"), name="sessions")
+
+    def interest(self, mask):
+        """Distinct visitors per product-interest bucket over the selected cells."""
+        n_buckets = len(self.interest_buckets)
+        if self.interest_visitors is None or n_buckets == 0:
+            return pd.Series(0, index=self.interest_buckets, dtype=np.int64)
+        bucket_of_key = np.tile(np.arange(n_buckets), len(mask))
+        counts = self.interest_visitors.count_by(np.repeat(mask, n_buckets), bucket_of_key, n_buckets)
+        return pd.Series(counts, index=self.interest_buckets)
+
+    def sum_by(self, mask, by, measure):
+        """Sum of a measure (or a list of them) over the selected cells, grouped by rollup dimensions."""
+        return self.cells[mask].groupby(by, observed=True)[measure].sum()
+
+    def merge(self, other):
+        """Rollup of the events of both rollups, e.g. the current dataset and an appended batch.
+
+        Only cells and sketches are combined; no event is read again.
+        """
+        if other.interest_buckets != self.interest_buckets:
+            raise ValueError("Can't merge rollups with different product-interest buckets.")
+        dimensions = [column for column in DIMENSIONS if column in self.cells.columns]
+        both = pd.concat([
+            combine_chunks([self.cells[dimensions], other.cells[dimensions]]),
+            pd.concat([self.cells[MEASURES], other.cells[MEASURES]], ignore_index=True),
+        ], axis=1)
+        grouped = both.groupby(dimensions, observed=True, dropna=False, sort=True)
+        cells = grouped[MEASURES].sum().reset_index()
+        new_cell = grouped.ngroup().to_numpy()
+        cell_map, other_cell_map = new_cell[:len(self.cells)], new_cell[len(self.cells):]
+
+        interest_visitors = None
+        if self.interest_visitors is not None and other.interest_visitors is not None:
+            # Interest keys are cell * n_buckets + bucket; renumber the cell part
+            buckets = np.arange(len(self.interest_buckets))
+            interest_visitors = self.interest_visitors.merge(
+                other.interest_visitors,
+                (cell_map[:, None] * len(buckets) + buckets).ravel(),
+                (other_cell_map[:, None] * len(buckets) + buckets).ravel(),
+            )
+        return DailyRollup(
+            cells,
+            sessions=self.sessions.merge(other.sessions, cell_map, other_cell_map),
+            interest_buckets=self.interest_buckets,
+            interest_visitors=interest_visitors,
+        )
+
+
+def build_daily_rollup(data, relative_error=None):
+    """Roll the dataset up into cells; ``relative_error`` switches the session counts to HyperLogLog.
+
+    ``data`` is a frame, or an out-of-core ArrowDataset, which is rolled up a batch at a time.
+    """
+    if isinstance(data, pd.DataFrame):
+        return _rollup_frame(data, relative_error)
+    rollup = None
+    for batch in data.batches():
+        batch_rollup = _rollup_frame(batch, relative_error)
+        rollup = batch_rollup if rollup is None else rollup.merge(batch_rollup)
+    return rollup
+
+
+def _rollup_frame(df, relative_error):
+    dimensions = [column for column in DIMENSIONS if column in df.columns]
+    not_purchased = df["purchased_product"] == "No Purchase"
+    flags = pd.DataFrame({
+        "events": 1,
+        "purchases": (~not_purchased).to_numpy(dtype=np.int64),
+        "named_purchases": (~not_purchased & df["purchased_product"].notna()).to_numpy(dtype=np.int64),
+        "demo_views": category_flags(df["page_name"], lambda labels: labels.str.lower().str.contains(DEMO_PAGE_KEYWORD, regex=False)).astype(np.int64),
+        "demo_requests": category_flags(df["page_name"], lambda labels: labels.str.lower() == DEMO_REQUEST_PAGE).astype(np.int64),
+    }, index=df.index)
+
+    grouped = pd.concat([df[dimensions], flags], axis=1).groupby(dimensions, observed=True, dropna=False, sort=True)
+    cells = grouped[MEASURES].sum().reset_index()
+    cell_of_row = grouped.ngroup().to_numpy()
+
+    # One (event, bucket) pair for every product bucket an event's page falls into
+    interest_buckets = list(PRODUCT_INTEREST_KEYWORDS)
+    interest_visitors = None
+    if "user_id" in df.columns:
+        membership, page_codes = bucket_membership(df["page_name"], PRODUCT_INTEREST_KEYWORDS)
+        rows, buckets = np.nonzero(membership[page_codes])
+        interest_keys = cell_of_row[rows].astype(np.int64) * len(interest_buckets) + buckets
+        interest_visitors = _distinct(interest_keys, df["user_id"].iloc[rows], relative_error=relative_error)
+
+    return DailyRollup(
+        cells,
+        sessions=_distinct(cell_of_row, df["session_id"], relative_error=relative_error),
+        interest_buckets=interest_buckets,
+        interest_visitors=interest_visitors,
+    )
+
+
+def get_daily_rollup(approximate=False):
+    """Rollup of the current dataset, built once per upload (and per mode) and shared by all pages."""
+    if approximate:
+        return get_artifact("daily_rollup_approximate", lambda df: build_daily_rollup(df, APPROXIMATE_DISTINCT_ERROR))
+    return get_artifact("daily_rollup", build_daily_rollup)
@@ -0,0 +1,73 @@
+import pandas as pd
+from pandas.api.types import is_integer_dtype, union_categoricals
+
+# Low-cardinality text columns stored as pandas categoricals (integer codes + one copy of each label)
+CATEGORICAL_COLUMNS = [
+    "country",
+    "referrer",
+    "processed_by",
+    "purchased_product",
+    "product_category",
+    "url_category",
+    "page_name",
+]
+
+# Identifier columns: kept as the smallest integer dtype when the log uses numeric ids,
+# otherwise dictionary-encoded like the columns above
+ID_COLUMNS = ["session_id", "user_id"]
+
+
+def _as_category(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    # Object-typed categories keep chunks that pandas typed differently (e.g. an all-empty
+    # chunk read as float) combinable with union_categoricals later on
+    categories = pd.Index(values.dropna().unique(), dtype=object)
+    try:
+        categories = categories.sort_values()
+    except TypeError:
+        pass
+    return pd.Series(pd.Categorical(values, categories=categories), index=values.index, name=values.name)
+
+
+def normalize_chunk(chunk):
+    """Cast one parsed chunk to the canonical column types."""
+    for column in CATEGORICAL_COLUMNS:
+        if column in chunk.columns:
+            chunk[column] = _as_category(chunk[column])
+
+    for column in ID_COLUMNS:
+        if column in chunk.columns and not is_integer_dtype(chunk[column].dtype):
+            chunk[column] = _as_category(chunk[column])
+
+    return chunk
+
+
+def _combine_column(parts):
+    if all(is_integer_dtype(part.dtype) for part in parts):
+        return pd.to_numeric(pd.concat(parts, ignore_index=True), downcast="integer")
+
+    if any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+        # Re-encode the per-chunk dictionaries against one shared set of categories. Sorted
+        # categories keep groupby/value_counts output in the same order plain strings had.
+        parts = [_as_category(part) for part in parts]
+        if parts[0].cat.ordered:
+            # Ordered period labels ("2025-01", "2025Q1") sort chronologically; identical
+            # categories (e.g. day names) keep their own order
+            if all(part.cat.categories.equals(parts[0].cat.categories) for part in parts):
+                return pd.Series(union_categoricals(parts), name=parts[0].name)
+            combined = union_categoricals(parts, sort_categories=True, ignore_order=True)
+            return pd.Series(combined.as_ordered(), name=parts[0].name)
+        try:
+            combined = union_categoricals(parts, sort_categories=True)
+        except TypeError:
+            combined = union_categoricals(parts)
+        return pd.Series(combined, name=parts[0].name)
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def combine_chunks(chunks):
+    """Concatenate normalized chunks without letting categoricals fall back to object strings."""
+    columns = {column: _combine_column([chunk[column] for chunk in chunks]) for column in chunks[0].columns}
+    return pd.DataFrame(columns)
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.backend import condition_mask
+from data_layer.rollup import CellTable
+from data_layer.schema import combine_chunks
+from data_layer.settings import FUNNEL_STEPS
+from data_layer.sketches import dense_codes
+from data_layer.store import get_artifact
+
+# One cell per day x country x session, so the overview's date and country filters select whole cells
+DIMENSIONS = ["date", "country", "session_id"]
+
+
+def _pack(reached):
+    """One uint64 per row with bit i set where column i of a boolean frame is True."""
+    flags = np.zeros(len(reached), dtype=np.uint64)
+    for bit, column in enumerate(reached.columns):
+        flags |= reached[column].to_numpy(dtype=np.uint64) << np.uint64(bit)
+    return flags
+
+
+def _or_pairs(grouped):
+    # Every key of a merge appears at most once per side, so OR-ing a group's first and last
+    # rows covers all of it. (combine_chunks may have downcast the flags to a smaller int.)
+    return grouped["flags"].first().to_numpy(dtype=np.uint64) | grouped["flags"].last().to_numpy(dtype=np.uint64)
+
+
+class SessionTable(CellTable):
+    """Events collapsed into sessions, for funnels with any steps over any date/country filter.
+
+    ``sessions`` has one row per session: when it started and ended, its first-touch referrer
+    and the funnel steps it reached as bit flags (bit i for ``steps[i]``). ``cells`` keeps the
+    steps reached per session, day and country, so the funnel of a selection is a bitwise OR
+    per session over the selected cells, one pass over sessions rather than one per step over
+    the raw events.
+    """
+
+    def __init__(self, steps, sessions, cells):
+        self.steps = steps
+        self.sessions = sessions
+        self.cells = cells
+
+    def reached(self, mask):
+        """Step flags of every session with events in the selected cells, one uint64 per session."""
+        # session_id may be categorical or (for numeric ids) a plain integer column
+        codes = dense_codes(self.cells["session_id"])[0][mask]
+        flags = self.cells["flags"].to_numpy()[mask]
+        if len(codes) == 0:
+            return flags
+        order = np.argsort(codes, kind="stable")
+        codes, flags = codes[order], flags[order]
+        return np.bitwise_or.reduceat(flags, np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]))
+
+    def funnel(self, mask, strict=False):
+        """Sessions reaching each step over the selected cells, as a Series in step order.
+
+        With ``strict`` a session only counts for a step if it also reached every earlier one.
+        """
+        bits = np.uint64(1) << np.arange(len(self.steps), dtype=np.uint64)
+        required = np.cumsum(bits, dtype=np.uint64) if strict else bits
+        reached = self.reached(mask)[:, None] & required
+        hits = reached == required if strict else reached != 0
+        return pd.Series(hits.sum(axis=0), index=self.steps, dtype=np.int64)
+
+    def merge(self, other):
+        """Session table of the events of both tables, e.g. the current dataset and an appended batch.
+
+        Sessions continuing from one table into the other are joined into one.
+        """
+        if other.steps != self.steps:
+            raise ValueError("Can't merge session tables with different funnel steps.")
+        both = combine_chunks([self.sessions.reset_index(), other.sessions.reset_index()]).sort_values("started", kind="stable")
+        grouped = both.groupby("session_id", observed=True, sort=True)
+        sessions = grouped.agg(started=("started", "min"), ended=("ended", "max"), first_referrer=("first_referrer", "first"))
+        sessions["flags"] = _or_pairs(grouped)
+
+        grouped = combine_chunks([self.cells, other.cells]).groupby(DIMENSIONS, observed=True, dropna=False, sort=True)
+        cells = grouped.size().index.to_frame(index=False)
+        cells["flags"] = _or_pairs(grouped)
+        return SessionTable(self.steps, sessions, cells)
+
+
+def build_session_table(data, steps=None):
+    """Session table of a frame, or of an out-of-core ArrowDataset a batch at a time.
+
+    ``steps`` maps step names to conditions as in FUNNEL_STEPS (the default).
+    """
+    steps = FUNNEL_STEPS if steps is None else steps
+    if isinstance(data, pd.DataFrame):
+        return _sessions_frame(data, steps)
+    table = None
+    for batch in data.batches():
+        batch_table = _sessions_frame(batch, steps)
+        table = batch_table if table is None else table.merge(batch_table)
+    return table
+
+
+def _sessions_frame(df, steps):
+    if len(steps) > 64:
+        raise ValueError("A funnel can have at most 64 steps.")
+    # Events without a session can't be sessionized
+    df = df[df["session_id"].notna()]
+    step_columns = [f"step_{bit}" for bit in range(len(steps))]
+    events = pd.concat([
+        df[["date", "country", "session_id", "timestamp", "referrer"]],
+        pd.DataFrame(dict(zip(step_columns, (condition_mask(df, conditions) for conditions in steps.values()))), index=df.index),
+    ], axis=1)
+
+    # Events are in timestamp order, so a session's first referrer is its first touch
+    grouped = events.groupby("session_id", observed=True, sort=True)
+    sessions = grouped.agg(started=("timestamp", "min"), ended=("timestamp", "max"), first_referrer=("referrer", "first"))
+    sessions["flags"] = _pack(grouped[step_columns].max())
+
+    reached = events.groupby(DIMENSIONS, observed=True, dropna=False, sort=True)[step_columns].max()
+    cells = reached.index.to_frame(index=False)
+    cells["flags"] = _pack(reached)
+    return SessionTable(list(steps), sessions, cells)
+
+
+def get_session_table():
+    """Session table of the current dataset for FUNNEL_STEPS, built once per upload and shared by all pages."""
+    return get_artifact("session_table", build_session_table)
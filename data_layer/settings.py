@@ -0,0 +1,134 @@
+import os
+import tomllib
+
+# Tunables shared by the upload page and the dashboard pages.
+
+# Rows parsed per chunk when streaming an uploaded CSV. Bounds the size of the
+# intermediate string buffers pandas holds while parsing a single chunk.
+CSV_CHUNK_ROWS = 250_000
+
+# CSV parser used for uploads: "arrow" parses on all cores with pyarrow (falling back to pandas
+# for files it rejects), "pandas" uses the single-threaded pandas C parser.
+CSV_ENGINE = "arrow"
+
+# Where uploaded datasets are kept as memory-mappable Arrow files, so a later session (or a
+# restarted server) can reopen the same upload without parsing the CSV again. Only the most
+# recently opened DATASET_CACHE_KEEP datasets are kept.
+DATASET_CACHE_DIR = os.environ.get(
+    "DASHBOARD_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".dataset_cache"),
+)
+DATASET_CACHE_KEEP = 5
+
+# Memory budget for datasets kept in the server process. Sessions viewing the same upload share
+# one copy; copies no session is viewing are dropped (least recently opened first) once the
+# datasets in memory exceed this. Datasets in use are never dropped.
+DATASET_MEMORY_BYTES = 4 * 1024 * 1024 * 1024
+
+# Cached datasets whose Arrow file is larger than this are not loaded into memory when reopened.
+# They are queried where they lie on disk instead (see data_layer.backend): filters and
+# aggregations run in Arrow's streaming engine and only the aggregated results reach pandas.
+OUT_OF_CORE_BYTES = 2 * 1024 * 1024 * 1024
+
+# Uploads expected to be larger than this once decompressed are never combined in memory: their
+# chunks are written to the dataset cache as they are parsed, and the dataset is queried out of
+# core from there. (The upload itself is still held in memory by Streamlit while it is read.)
+STREAMED_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024
+
+# Event counts memoized per out-of-core dataset (per filter state and grouping), so reruns and
+# pages asking the same question don't scan the file again; least recently used dropped first.
+OUT_OF_CORE_COUNT_ENTRIES = 1024
+
+# Rows offered for download on the Raw Data page; a larger selection exports only its first
+# rows. A prepared download is held in the session's memory (Streamlit serves it from there),
+# so this bounds the memory an export takes, in memory or out of core.
+RAW_DATA_EXPORT_ROWS = 1_000_000
+
+# Page sizes of the Raw Data table; only the visible page of rows is fetched and sent to the browser.
+RAW_DATA_PAGE_SIZES = [100, 500, 1000]
+
+# Live mode: log files dropped into this directory are appended to a shared dataset in the
+# background (set it in dashboard.toml as [live] directory = "..."). Files are picked up once
+# they have stopped changing for LIVE_SETTLE_SECONDS; open dashboards showing the live dataset
+# check for new data every LIVE_REFRESH_SECONDS.
+LIVE_INGEST_DIR = None
+LIVE_SETTLE_SECONDS = 5
+LIVE_REFRESH_SECONDS = 60
+
+# Memory cap for the row selections the filter engine memoizes per filter state (per dataset).
+# Least recently used selections are evicted first.
+FILTER_CACHE_BYTES = 256 * 1024 * 1024
+
+# Disk budget for the export files of the Raw Data page (per dataset). Exports are written on
+# request to a temporary directory and kept per filter state and format, so downloading the same
+# selection again doesn't encode it again; least recently used files are deleted first.
+EXPORT_CACHE_BYTES = 1024 * 1024 * 1024
+
+# Built chart figures kept per dataset (least recently used dropped first), so a rerun with
+# unchanged filters reuses every figure instead of aggregating and building it again.
+FIGURE_CACHE_ENTRIES = 256
+
+# Relative standard error targeted by the approximate (HyperLogLog) distinct counts the
+# overview page offers for sessions and users. Smaller values use more memory per sketch.
+APPROXIMATE_DISTINCT_ERROR = 0.02
+
+# "Interest in Key Products" buckets on the overview page, in display order. A visitor counts
+# as interested in a product when they viewed a page whose name contains one of its keywords
+# (case-insensitive).
+PRODUCT_INTEREST_KEYWORDS = {
+    "AI Assistant": ["virtual assistant"],
+    "Prototyping Tools": ["ui/ux design generator", "prototyping tool"],
+    "Sales & CRM Optimization": ["sales & crm optimization"],
+    "HR & Recruitment Tool": ["hr & recruitment tool"],
+    "Document Processor License": ["document processor license"],
+    "Predictive Analytics Platform": ["predictive analytics platform"],
+    "Software Testing Tool": ["software testing tool"],
+}
+
+# Steps of the overview's purchase funnel, in order. A session reaches a step when one of its
+# events meets all of the step's conditions: (column, op, value) triples with op "==", "!="
+# or "notna", as in data_layer.backend queries. A step without conditions is every session.
+# At most 64 steps.
+FUNNEL_STEPS = {
+    "Visit Website": [],
+    "View Product": [("url_category", "==", "products")],
+    "Purchase": [("purchased_product", "!=", "No Purchase")],
+}
+
+# Pages counted as scheduled demos (name contains the keyword) and as demo requests (exact name)
+DEMO_PAGE_KEYWORD = "demo"
+DEMO_REQUEST_PAGE = "demo request"
+
+
+def _load_overrides(path):
+    try:
+        with open(path, "rb") as config_file:
+            return tomllib.load(config_file)
+    except FileNotFoundError:
+        return {}
+
+
+# Deployments can override the product buckets without touching code, e.g. in dashboard.toml
+# next to upload.py:
+#
+#   [product_interest]
+#   "AI Assistant" = ["virtual assistant", "chatbot"]
+_overrides = _load_overrides(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dashboard.toml"))
+PRODUCT_INTEREST_KEYWORDS = _overrides.get("product_interest", PRODUCT_INTEREST_KEYWORDS)
+
+#   [upload]
+#   csv_engine = "pandas"
+CSV_ENGINE = _overrides.get("upload", {}).get("csv_engine", CSV_ENGINE)
+
+#   [live]
+#   directory = "/srv/exports/hourly"
+#   refresh_seconds = 30
+LIVE_INGEST_DIR = _overrides.get("live", {}).get("directory", LIVE_INGEST_DIR)
+LIVE_REFRESH_SECONDS = _overrides.get("live", {}).get("refresh_seconds", LIVE_REFRESH_SECONDS)
+
+#   [funnel]
+#   "Visit Website" = []
+#   "Request Demo" = [["page_name", "==", "demo request"]]
+#   "Purchase" = [["purchased_product", "!=", "No Purchase"], ["purchased_product", "notna", ""]]
+if "funnel" in _overrides:
+    FUNNEL_STEPS = {step: [tuple(condition) for condition in conditions] for step, conditions in _overrides["funnel"].items()}
@@ -0,0 +1,169 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def dense_codes(values):
+    """Dense integer codes (0..k-1, -1 for missing) of an id column and the k labels they stand for."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques)
+
+
+def value_hashes(values):
+    """Stable 64-bit hashes of an id column and a mask of the non-missing rows.
+
+    Categoricals hash each distinct label once; hashing labels rather than codes keeps
+    sketches of different uploads of the same log mergeable.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        label_hashes = pd.util.hash_array(values.cat.categories.to_numpy())
+        return label_hashes[codes], codes >= 0
+    present = values.notna().to_numpy()
+    return pd.util.hash_array(values.to_numpy()), present
+
+
+def precision_for_error(relative_error):
+    """HyperLogLog precision p (2**p registers) whose standard error is at most ``relative_error``."""
+    registers = (1.04 / relative_error) ** 2
+    return min(max(math.ceil(math.log2(registers)), 4), 16)
+
+
+def _leading_zeros(words):
+    # Smear the highest set bit downwards; the popcount is then the bit length
+    words = words.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        words |= words >> np.uint64(shift)
+    return 64 - np.bitwise_count(words).astype(np.int64)
+
+
+def _estimate(registers):
+    # Standard HyperLogLog estimate with linear counting for small cardinalities; registers
+    # is (n_sketches, m). A 64-bit hash needs no large-range correction.
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=-1)
+    zeros = np.sum(registers == 0, axis=-1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class HyperLogLog:
+    """Approximate, mergeable distinct counter over the cells of a rollup.
+
+    Keeps one sparse HyperLogLog sketch per cell as (cell, register, rank) triples holding
+    the highest rank seen. Merging cells is an element-wise max of their registers, so the
+    memory per cell is bounded by 2**precision however many values it holds.
+    """
+
+    approximate = True
+
+    def __init__(self, precision, keys, ranks):
+        # keys are cell * 2**precision + register; only the highest rank per key is kept
+        self.precision = precision
+        self.m = 1 << precision
+        if len(keys) == 0:
+            # Nothing was counted (e.g. no page matched an interest bucket): every register is empty
+            self.cells = np.empty(0, dtype=np.int64)
+            self.registers = np.empty(0, dtype=np.int32)
+            self.ranks = np.empty(0, dtype=np.uint8)
+            return
+        order = np.lexsort((ranks, keys))
+        keys, ranks = keys[order], ranks[order]
+        # After sorting by (key, rank) the last entry of every key holds its maximum rank
+        last = np.append(keys[1:] != keys[:-1], True)
+        keys, self.ranks = keys[last], ranks[last].astype(np.uint8)
+        self.cells = keys // self.m
+        self.registers = (keys % self.m).astype(np.int32)
+
+    @classmethod
+    def from_hashes(cls, cells, hashes, precision):
+        registers = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+        remaining = hashes << np.uint64(precision)
+        ranks = np.minimum(_leading_zeros(remaining) + 1, 64 - precision + 1)
+        return cls(precision, cells.astype(np.int64) * (1 << precision) + registers, ranks)
+
+    @classmethod
+    def from_column(cls, cells, column, row_mask=None, relative_error=0.02):
+        hashes, present = value_hashes(column)
+        if row_mask is not None:
+            present = present & row_mask
+        return cls.from_hashes(cells[present], hashes[present], precision_for_error(relative_error))
+
+    def merge(self, other, cell_map, other_cell_map):
+        """Union with another sketch, after renumbering both sides' cells through the maps."""
+        if other.precision != self.precision:
+            raise ValueError("Can't merge HyperLogLog sketches of different precision.")
+        keys = np.concatenate([
+            cell_map[self.cells].astype(np.int64) * self.m + self.registers,
+            other_cell_map[other.cells].astype(np.int64) * self.m + other.registers,
+        ])
+        return HyperLogLog(self.precision, keys, np.concatenate([self.ranks, other.ranks]))
+
+    def count(self, cell_mask):
+        """Estimated distinct values over the cells where ``cell_mask`` is True."""
+        selected = cell_mask[self.cells]
+        registers = np.zeros(self.m, dtype=np.uint8)
+        np.maximum.at(registers, self.registers[selected], self.ranks[selected])
+        return int(round(float(_estimate(registers))))
+
+    def count_by(self, cell_mask, cell_groups, n_groups):
+        """Estimated distinct values per group, for a group number assigned to every cell."""
+        selected = cell_mask[self.cells]
+        slots = cell_groups[self.cells[selected]].astype(np.int64) * self.m + self.registers[selected]
+        registers = np.zeros(n_groups * self.m, dtype=np.uint8)
+        np.maximum.at(registers, slots, self.ranks[selected])
+        return np.rint(_estimate(registers.reshape(n_groups, self.m))).astype(np.int64)
+
+
+class DistinctSet:
+    """Exact, mergeable distinct counter over the cells of a rollup.
+
+    Stores the unique (cell, value) pairs, so the distinct values of any union of cells can
+    be counted without going back to the raw events.
+    """
+
+    approximate = False
+
+    def __init__(self, cells, values, labels):
+        # values are codes into labels (-1 for missing)
+        self.labels = labels
+        self.n_values = max(len(labels), 1)
+        present = values >= 0
+        keys = np.unique(cells[present].astype(np.int64) * self.n_values + values[present])
+        self.cells = keys // self.n_values
+        self.values = keys % self.n_values
+
+    @classmethod
+    def from_column(cls, cells, column, row_mask=None):
+        codes, labels = dense_codes(column)
+        if row_mask is not None:
+            cells, codes = cells[row_mask], codes[row_mask]
+        return cls(cells, codes, labels)
+
+    def merge(self, other, cell_map, other_cell_map):
+        """Union with another set, after renumbering both sides' cells through the maps.
+
+        This set's value codes stay as they are; the other's are re-coded by label.
+        """
+        labels = self.labels.append(other.labels).unique()
+        other_values = labels.get_indexer(other.labels)[other.values]
+        cells = np.concatenate([cell_map[self.cells], other_cell_map[other.cells]])
+        return DistinctSet(cells, np.concatenate([self.values, other_values]), labels)
+
+    def count(self, cell_mask):
+        """Distinct values over the cells where ``cell_mask`` is True."""
+        seen = np.zeros(self.n_values, dtype=bool)
+        seen[self.values[cell_mask[self.cells]]] = True
+        return int(seen.sum())
+
+    def count_by(self, cell_mask, cell_groups, n_groups):
+        """Distinct values per group, for a group number assigned to every cell."""
+        selected = cell_mask[self.cells]
+        groups = cell_groups[self.cells[selected]].astype(np.int64)
+        pairs = np.unique(groups * self.n_values + self.values[selected])
+        return np.bincount(pairs // self.n_values, minlength=n_groups)
@@ -0,0 +1,170 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+import pandas as pd
+import streamlit as st
+
+from data_layer.settings import DATASET_MEMORY_BYTES
+
+# With copy-on-write every selection, slice or shallow copy of the canonical frame shares its
+# column buffers; data is only copied when a page actually writes to it. That is what lets
+# every session viewing the same upload share one frame. The option is process-wide on purpose
+# (and pandas 3's default): any code holding a frame from the registry, in any session or
+# thread, must not write through to it, so it can't be scoped to the data layer's own calls.
+pd.set_option("mode.copy_on_write", True)
+
+HANDLE_KEY = "dataset_handle"
+
+
+class _Entry:
+    def __init__(self, data):
+        if isinstance(data, pd.DataFrame):
+            self.df, self.dataset = data, None
+            self.nbytes = int(data.memory_usage(deep=True).sum())
+        else:
+            # An out-of-core dataset (see data_layer.backend) stays on disk and costs no memory
+            self.df, self.dataset = None, data
+            self.nbytes = 0
+        self.artifacts = {}
+        self.sessions = 0
+        # Bumped whenever the dataset is replaced by a newer version (live ingestion)
+        self.version = 0
+
+
+class DatasetHandle:
+    """A session's claim on a registered dataset; the claim is released when the handle is dropped."""
+
+    def __init__(self, registry, key, entry):
+        self.key = key
+        self.entry = entry
+        weakref.finalize(self, registry.release, key)
+
+
+class DatasetRegistry:
+    """Process-wide datasets keyed by content hash, shared by every session that opens them.
+
+    Entries count the sessions holding a handle. Entries no session holds stay around for
+    quick reopening until the total size exceeds ``max_bytes``; then the least recently
+    opened of them are dropped first.
+    """
+
+    def __init__(self, max_bytes=DATASET_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Releases not applied yet (see release)
+        self._released = deque()
+
+    def acquire(self, key, load):
+        """A handle on dataset ``key``; ``load()`` builds the frame (or ArrowDataset) if it isn't registered."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            # Parse outside the lock so other sessions aren't blocked; the first one wins a race
+            entry = _Entry(load())
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            self._entries.move_to_end(key)
+            entry.sessions += 1
+            handle = DatasetHandle(self, key, entry)
+            self._evict()
+        return handle
+
+    def release(self, key):
+        # Runs from a handle's finalizer, which the cyclic GC may call at any allocation, even on
+        # a thread that holds the lock. So it never waits for the lock: the release is queued and
+        # applied now if the lock is free, otherwise by the next call that takes it.
+        self._released.append(key)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._evict()
+            finally:
+                self._lock.release()
+
+    def artifact(self, entry, name, build):
+        # The data and its artifacts are read together: if replace() swaps in a newer version
+        # during the build, the artifact goes into the old version's dict, never the new one's
+        with self._lock:
+            data = entry.df if entry.df is not None else entry.dataset
+            artifacts = entry.artifacts
+            artifact = artifacts.get(name)
+        if artifact is None:
+            artifact = build(data)
+            with self._lock:
+                artifact = artifacts.setdefault(name, artifact)
+        return artifact
+
+    def replace(self, entry, df, artifacts):
+        """Swap in a newer version of a dataset; sessions holding it see it on their next rerun."""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            entry.df, entry.artifacts, entry.nbytes = df, dict(artifacts), nbytes
+            entry.version += 1
+            self._evict()
+
+    def forget_file(self, key):
+        """Let the cached file of dataset ``key`` be deleted, unless a session is reading it.
+
+        Returns False while an out-of-core dataset over the file is in use. One no session
+        holds is dropped here, as it can't outlive its file.
+        """
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is None or entry.dataset is None:
+                return True
+            if entry.sessions > 0:
+                return False
+            del self._entries[key]
+            return True
+
+    def seed(self, entry, artifacts):
+        with self._lock:
+            for name, artifact in artifacts.items():
+                entry.artifacts.setdefault(name, artifact)
+
+    def _evict(self):
+        while self._released:
+            entry = self._entries.get(self._released.popleft())
+            if entry is not None:
+                entry.sessions -= 1
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for key in [key for key, entry in self._entries.items() if entry.sessions <= 0]:
+            if total <= self.max_bytes:
+                break
+            total -= self._entries.pop(key).nbytes
+
+
+@st.cache_resource
+def get_registry():
+    return DatasetRegistry()
+
+
+def publish_dataset(key, load):
+    """Make dataset ``key`` (a content hash) the dataset of this browser session.
+
+    ``load()`` is only called when no session has the dataset in memory already.
+    """
+    st.session_state[HANDLE_KEY] = get_registry().acquire(key, load)
+
+
+def get_dataset_handle():
+    """This session's DatasetHandle, or None before anything was opened."""
+    return st.session_state.get(HANDLE_KEY)
+
+
+def seed_artifacts(artifacts):
+    """Hand the current dataset artifacts that were already built elsewhere (e.g. updated for an append)."""
+    get_registry().seed(st.session_state[HANDLE_KEY].entry, artifacts)
+
+
+def get_artifact(name, build):
+    """A structure derived from the current dataset (rollups, indexes, ...), built on first use.
+
+    ``build(df)`` runs once per dataset; every session, page and rerun after that reuses the result.
+    For an out-of-core dataset ``build`` is handed the ArrowDataset instead of a frame.
+    """
+    handle = st.session_state[HANDLE_KEY]
+    return get_registry().artifact(handle.entry, name, build)
+
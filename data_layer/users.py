@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.rollup import CellTable
+from data_layer.schema import combine_chunks
+from data_layer.sketches import DistinctSet, dense_codes
+from data_layer.store import get_artifact
+
+# One visit cell per day x country x user, so the overview's date and country filters select
+# whole cells
+DIMENSIONS = ["date", "country", "user_id"]
+
+
+class UserVisits(CellTable):
+    """Per-user activity for customer metrics (new vs. returning, retention, ...) over any filter.
+
+    Each cell holds one user's event count on one day in one country, with an exact DistinctSet
+    of the sessions per cell. Summing the selected cells per user gives every user's first and
+    last visit, events and sessions in the selection in one vectorized pass, without going back
+    to the raw events.
+    """
+
+    def __init__(self, cells, sessions):
+        self.cells = cells
+        self.sessions = sessions
+        # user_id may be categorical or (for numeric ids) a plain integer column
+        self._user_of_cell, self.users = dense_codes(cells["user_id"])
+
+    def summary(self, mask):
+        """One row per user seen in the selected cells: first_seen, last_seen, events and sessions."""
+        users = self._user_of_cell[mask]
+        dates = self.cells["date"].to_numpy()[mask]
+        events = np.bincount(users, weights=self.cells["events"].to_numpy()[mask], minlength=len(self.users))
+        sessions = self.sessions.count_by(mask, self._user_of_cell, len(self.users))
+        # Cells are ordered by date: a user's first selected cell is their first visit, the last their last
+        active, first = np.unique(users, return_index=True)
+        _, from_end = np.unique(users[::-1], return_index=True)
+        return pd.DataFrame({
+            "first_seen": dates[first],
+            "last_seen": dates[len(users) - 1 - from_end],
+            "events": events[active].astype(np.int64),
+            "sessions": sessions[active],
+        }, index=pd.Index(self.users[active], name="user_id"))
+
+    def merge(self, other):
+        """Visit table of the events of both tables, e.g. the current dataset and an appended batch."""
+        both = pd.concat([
+            combine_chunks([self.cells[DIMENSIONS], other.cells[DIMENSIONS]]),
+            pd.concat([self.cells["events"], other.cells["events"]], ignore_index=True),
+        ], axis=1)
+        grouped = both.groupby(DIMENSIONS, observed=True, dropna=False, sort=True)
+        cells = grouped["events"].sum().reset_index()
+        new_cell = grouped.ngroup().to_numpy()
+        return UserVisits(cells, self.sessions.merge(other.sessions, new_cell[:len(self.cells)], new_cell[len(self.cells):]))
+
+
+def build_user_visits(data):
+    """Visit table of a frame, or of an out-of-core ArrowDataset a batch at a time."""
+    if isinstance(data, pd.DataFrame):
+        return _visits_frame(data)
+    visits = None
+    for batch in data.batches(columns=DIMENSIONS + ["session_id"]):
+        batch_visits = _visits_frame(batch)
+        visits = batch_visits if visits is None else visits.merge(batch_visits)
+    return visits
+
+
+def _visits_frame(df):
+    # Events without a user can't be attributed to a customer
+    df = df.loc[df["user_id"].notna(), DIMENSIONS + ["session_id"]]
+    grouped = df[DIMENSIONS].groupby(DIMENSIONS, observed=True, dropna=False, sort=True)
+    cells = grouped.size().reset_index(name="events")
+    return UserVisits(cells, DistinctSet.from_column(grouped.ngroup().to_numpy(), df["session_id"]))
+
+
+def get_user_visits():
+    """Visit table of the current dataset, built once per upload and shared by all pages."""
+    return get_artifact("user_visits", build_user_visits)
@@ -1,5 +1,9 @@
 import streamlit as st
-import pandas as pd
+
+from data_layer.backend import get_query_backend
+from data_layer.export import EXPORT_FORMATS, export_events
+from data_layer.live import refresh_when_updated
+from data_layer.settings import RAW_DATA_EXPORT_ROWS, RAW_DATA_PAGE_SIZES
 
 st.markdown("""
     <style>
@@ -18,26 +22,10 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Function to get the uploaded data from session state
-def get_uploaded_data():
-    if "uploaded_data" in st.session_state:
-        return st.session_state["uploaded_data"].copy()
-    else:
-        st.warning("Please upload data on the 'Upload Data' page first.")
-        st.page_link("upload.py", label="Upload Data", icon=":material/upload:")
-        return None
-
-df = get_uploaded_data()
-
-if df is not None:
-    try:
-        df['date'] = df['timestamp'].dt.date
-        df['month'] = df['timestamp'].dt.to_period("M").astype(str)
-        df['year'] = df['timestamp'].dt.year
-        df['hour'] = df['timestamp'].dt.hour
-    except AttributeError as e:
-        st.error(f"Data processing error: {e}")
-        st.stop()
+backend = get_query_backend()
+if backend is None:
+    st.stop()
+refresh_when_updated()
 
 with st.sidebar:
     st.logo("ai_solutions1.png")
@@ -50,64 +38,121 @@ with st.sidebar:
 
     st.markdown("---")
     st.title("Raw Data Filters")
-    min_date = df['timestamp'].min().date()
-    max_date = df['timestamp'].max().date()
+    selected_dates = None
+    selected_sales_persons = []
+    selected_products = []
+    selected_quarters = []
+
+    min_date, max_date = backend.date_range()
     date_range = st.date_input("Select date range", value=(min_date, max_date), min_value=min_date, max_value=max_date)
     if isinstance(date_range, tuple) and len(date_range) == 2:
-        start_date, end_date = date_range
-        df_filtered = df[(df['timestamp'].dt.date >= start_date) & (df['timestamp'].dt.date <= end_date)].copy()
+        selected_dates = date_range
     else:
         st.warning("Please select a valid date range in the sidebar.")
-        df_filtered = df.copy()
-    country_list = df['country'].dropna().unique().tolist()
+    country_list = backend.options('country')
     selected_countries = st.multiselect("Filter by Country", options=country_list, default=[])
-    if selected_countries:
-        df_filtered = df_filtered[df_filtered['country'].isin(selected_countries)]
-    if 'processed_by' in df.columns:
-        sales_person_list = df['processed_by'].dropna().unique().tolist()
+    if 'processed_by' in backend.columns:
+        sales_person_list = backend.options('processed_by')
         selected_sales_persons = st.multiselect("Filter by Sales Person", options=sales_person_list, default=[])
-        if selected_sales_persons:
-            df_filtered = df_filtered[df_filtered['processed_by'].isin(selected_sales_persons)]
     else:
         st.warning("The 'processed_by' column is not available in the dataset.")
 
         # Product filter
-    if 'purchased_product' in df.columns:
+    if 'purchased_product' in backend.columns:
         # Exclude "No Purchase" from the product list
-        product_list = df[df['purchased_product'] != "No Purchase"]['purchased_product'].dropna().unique().tolist()
+        product_list = [product for product in backend.options('purchased_product') if product != "No Purchase"]
 
         selected_products = st.multiselect("Filter by Product", options=product_list, default=[])
-        if selected_products:
-            df_filtered = df_filtered[df_filtered['purchased_product'].isin(selected_products)]
 
             
     # Quarter filter
-    if 'timestamp' in df.columns:
-        # Ensure 'timestamp' is in datetime format
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        df['quarter'] = df['timestamp'].dt.to_period("Q").astype(str)  # Extract quarter information (e.g., "2025Q1")
-        df_filtered['quarter'] = df['quarter']
-        quarter_list = df['quarter'].dropna().unique().tolist()
+    if 'quarter' in backend.columns:
+        quarter_list = backend.options('quarter')
         selected_quarters = st.multiselect("Filter by Quarter", options=quarter_list, default=[])
-        if selected_quarters:
-            df_filtered = df_filtered[df_filtered['quarter'].isin(selected_quarters)]
+
+# Rows matching every sidebar filter
+filter_state = backend.key(
+    selected_dates,
+    country=selected_countries,
+    processed_by=selected_sales_persons,
+    purchased_product=selected_products,
+    quarter=selected_quarters,
+)
 
 
 
 st.title("Raw Data")
 st.write("Below is the raw data based on the applied filters.")
-st.dataframe(df_filtered)
-
 
-def convert_df_to_csv(data_frame):
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return data_frame.to_csv().encode('utf-8')
 
-csv_data = convert_df_to_csv(df_filtered)
-
-st.download_button(
-    label="Download as CSV",
-    data=csv_data,
-    file_name='filtered_data.csv',
-    mime='text/csv',
-)
+# The table is a fragment: searching, sorting and paging rerun only the table. The backend
+# searches and sorts the matching rows, and only the visible page is sent to the browser.
+@st.fragment
+def raw_data_table(filter_state):
+    search_column_col, search_col, sort_col, order_col = st.columns((1, 2, 1, 1))
+    with search_column_col:
+        search_column = st.selectbox("Search in", backend.columns, key="raw_data_search_column")
+    with search_col:
+        search_text = st.text_input("Search", key="raw_data_search", placeholder=f"Text in '{search_column}'")
+    with sort_col:
+        order_by = st.selectbox("Sort by", backend.columns, index=None, placeholder="Upload order", key="raw_data_sort")
+    with order_col:
+        descending = st.toggle("Descending", key="raw_data_descending", disabled=order_by is None)
+
+    where = [(search_column, "contains", search_text)] if search_text else []
+    matching_rows = backend.count(filter_state, where=where)
+
+    page_size_col, page_col, _ = st.columns((1, 1, 3))
+    with page_size_col:
+        page_size = st.selectbox("Rows per page", RAW_DATA_PAGE_SIZES, key="raw_data_page_size")
+    page_count = max(1, -(-matching_rows // page_size))
+    with page_col:
+        page_number = st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, step=1)
+
+    offset = (page_number - 1) * page_size
+    page = backend.page(filter_state, offset, page_size, order_by=order_by, descending=descending, where=where)
+    if matching_rows:
+        st.caption(f"Rows {offset + 1:,}–{offset + len(page):,} of {matching_rows:,}")
+    st.dataframe(page)
+
+
+raw_data_table(filter_state)
+
+# Exports are built only when asked for: streamed from the backend to a file a batch at a
+# time and cached per filter state and format, so preparing the same export again doesn't
+# encode it again. The prepared bytes stay in the session only while they match the selection,
+# and only the first RAW_DATA_EXPORT_ROWS rows are exported, which keeps a broad filter on a
+# huge dataset from producing a file too large to hand to the browser.
+@st.fragment
+def export_controls(filter_state):
+    matching_rows = backend.count(filter_state)
+    if matching_rows > RAW_DATA_EXPORT_ROWS:
+        st.caption(f"This selection is too large to download whole; downloading the first {RAW_DATA_EXPORT_ROWS:,} of {matching_rows:,} matching rows.")
+
+    format_col, button_col, _ = st.columns((1, 1, 3), vertical_alignment="bottom")
+    with format_col:
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS), format_func=lambda export_format: EXPORT_FORMATS[export_format][0], key="raw_data_export_format")
+    label, extension, mime = EXPORT_FORMATS[export_format]
+
+    # This session's prepared export, dropped as soon as the selection or format changes
+    export_query = (filter_state, export_format, RAW_DATA_EXPORT_ROWS)
+    prepared = st.session_state.get("raw_data_export")
+    if prepared is not None and prepared[0] != export_query:
+        del st.session_state["raw_data_export"]
+        prepared = None
+
+    with button_col:
+        if prepared is None and st.button("Prepare download"):
+            with st.spinner(f"Preparing {label} export..."):
+                prepared = (export_query, export_events(backend, filter_state, export_format, RAW_DATA_EXPORT_ROWS))
+            st.session_state["raw_data_export"] = prepared
+        if prepared is not None:
+            st.download_button(
+                label=f"Download as {label}",
+                data=prepared[1],
+                file_name=f'filtered_data.{extension}',
+                mime=mime,
+            )
+
+
+export_controls(filter_state)
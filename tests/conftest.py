@@ -0,0 +1,98 @@
+import io
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from data_layer.derived import prepare_dataset
+from data_layer.schema import normalize_chunk
+from data_layer.store import HANDLE_KEY, get_registry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _make_events(rows=600, seed=0, numeric_ids=False, start="2024-01-01"):
+    """A small random event log over 90 days from ``start``, prepared as an upload is
+    (normalized, sorted, calendar columns)."""
+    rng = np.random.default_rng(seed)
+    sessions = rng.integers(0, rows // 4, rows)
+    df = pd.DataFrame({
+        "timestamp": pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, 90 * 86400, rows)), unit="s"),
+        "session_id": sessions if numeric_ids else [f"s{s}" for s in sessions],
+        "user_id": sessions // 3 if numeric_ids else [f"u{s // 3}" for s in sessions],
+        "country": rng.choice(["Germany", "India", "Kenya"], rows),
+        "referrer": rng.choice(["Email", "LinkedIn", "Search"], rows),
+        "page_name": rng.choice(["Home", "Schedule Demo", "CRM Suite"], rows),
+        "url_category": rng.choice(["info", "products", "support"], rows),
+        "purchased_product": rng.choice(["No Purchase", "No Purchase", "CRM Suite", "AI Assistant"], rows),
+        "product_category": rng.choice(["AI", "Services"], rows),
+        "processed_by": rng.choice(["Alice", "Bob", "Unassigned"], rows),
+    })
+    return prepare_dataset(normalize_chunk(df))
+
+
+class _Upload(io.BytesIO):
+    """In-memory stand-in for Streamlit's UploadedFile (a BytesIO with a size)."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.size = len(data)
+
+
+@pytest.fixture(params=[False, True], ids=["string_ids", "numeric_ids"])
+def events(request):
+    return _make_events(numeric_ids=request.param)
+
+
+@pytest.fixture
+def make_events():
+    """Make other event logs: ``make_events(rows=600, seed=0, numeric_ids=False, start="2024-01-01")``."""
+    return _make_events
+
+
+@pytest.fixture
+def sample_csv():
+    """Three log lines as uploaded, before any normalization."""
+    return b"""timestamp,session_id,user_id,country,referrer,page_name,url_category,purchased_product,product_category,processed_by
+2024-01-01 00:00:01,s1,u1,Germany,Email,Home,info,No Purchase,AI,Unassigned
+2024-01-01 00:00:02,s1,u1,Germany,Email,CRM Suite,products,CRM Suite,Services,Alice
+2024-01-02 10:30:00,s2,u2,India,Search,Home,info,No Purchase,AI,Unassigned
+"""
+
+
+@pytest.fixture
+def make_upload():
+    """Wrap bytes as an uploaded file: ``make_upload(data)``."""
+    return _Upload
+
+
+@pytest.fixture
+def merge_halves(events):
+    """Merge an artifact built from each half of ``events``: ``merge_halves(build)``.
+
+    Compared with ``build(events)``, this checks the artifact's merge (as an append uses it)."""
+    half = len(events) // 2
+    return lambda build: build(events.iloc[:half]).merge(build(events.iloc[half:]))
+
+
+@pytest.fixture
+def without_navigation(monkeypatch):
+    """Make page links and page switches no-ops, for AppTests of single pages."""
+    # Navigation needs the multipage app around the page; there is none in a test
+    monkeypatch.setattr(st, "page_link", lambda *args, **kwargs: None)
+    monkeypatch.setattr(st, "switch_page", lambda *args, **kwargs: None)
+
+
+@pytest.fixture
+def page_app(without_navigation):
+    """Make an AppTest of a page (path relative to the repository) with ``df`` open as its dataset."""
+    def make(page, df):
+        at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=30)
+        at.session_state[HANDLE_KEY] = get_registry().acquire(f"test:{uuid.uuid4()}", lambda: df)
+        return at
+
+    return make
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_layer.append import append_batch
+from data_layer.filters import FilterEngine
+from data_layer.rollup import build_daily_rollup
+from data_layer.sessions import build_session_table
+from data_layer.users import build_user_visits
+
+
+def build_artifacts(df):
+    return {
+        "daily_rollup": build_daily_rollup(df),
+        "filter_engine": FilterEngine(df),
+        "user_visits": build_user_visits(df),
+        "session_table": build_session_table(df),
+    }
+
+
+@pytest.fixture
+def halves(events):
+    # Interleaved in time, so the batch is slotted into the dataset rather than added at the end
+    return events.iloc[::2].reset_index(drop=True), events.iloc[1::2].reset_index(drop=True)
+
+
+def test_appended_batch_matches_a_fresh_build(events, halves):
+    df, batch = halves
+    artifacts = build_artifacts(df)
+    key = artifacts["filter_engine"].key(country=["India"])
+    artifacts["filter_engine"].select(key)
+    # Events already in the dataset, and repeats within the batch, are dropped
+    batch = pd.concat([batch, df.iloc[:20], batch.iloc[:5]], ignore_index=True).sort_values("timestamp", kind="stable")
+
+    merged, updated, new_events = append_batch(df, artifacts, batch)
+    assert len(new_events) == len(events) - len(df)
+    assert merged["timestamp"].tolist() == events["timestamp"].tolist()
+
+    fresh = build_artifacts(merged)
+    everything = np.ones(len(fresh["daily_rollup"].cells), dtype=bool)
+    assert updated["daily_rollup"].totals(np.ones(len(updated["daily_rollup"].cells), dtype=bool)) == fresh["daily_rollup"].totals(everything)
+    assert np.array_equal(np.arange(len(merged))[updated["filter_engine"].select(key)], np.arange(len(merged))[fresh["filter_engine"].select(key)])
+    visits = updated["user_visits"]
+    assert visits.summary(visits.select()).sort_index().equals(fresh["user_visits"].summary(fresh["user_visits"].select()).sort_index())
+    sessions = updated["session_table"]
+    assert sessions.funnel(sessions.select()).tolist() == fresh["session_table"].funnel(fresh["session_table"].select()).tolist()
+
+
+def test_batches_without_new_events_or_with_other_columns_are_rejected(halves):
+    df, batch = halves
+    with pytest.raises(ValueError, match="no events"):
+        append_batch(df, {}, df.iloc[:10])
+    with pytest.raises(ValueError, match="columns"):
+        append_batch(df, {}, batch.drop(columns="referrer"))
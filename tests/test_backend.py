@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from data_layer.backend import ArrowDataset, FrameBackend, condition_mask
+from data_layer.filters import FilterEngine
+
+
+def arrow_dataset(df, path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_file(str(path), table.schema) as writer:
+        # Several batches, so pages and sorts span batch boundaries
+        writer.write_table(table, max_chunksize=100)
+    return ArrowDataset(str(path))
+
+
+def test_arrow_dataset_counts_are_memoized(events, tmp_path, monkeypatch):
+    dataset = arrow_dataset(events, tmp_path / "events.arrow")
+    key = dataset.key(country=["India"])
+    expected = events[events["country"] == "India"]
+
+    scans = []
+    aggregate = dataset._aggregate
+    monkeypatch.setattr(dataset, "_aggregate", lambda *args, **kwargs: scans.append(args) or aggregate(*args, **kwargs))
+    for _ in range(2):
+        assert dataset.count(key) == len(expected)
+        by_page = dataset.count(key, by="page_name")
+        assert by_page.to_dict() == expected["page_name"].value_counts().to_dict()
+        by_page[:] = 0
+    assert len(scans) == 2
+
+
+def test_frame_backend_counts_take_only_the_columns_they_read(events, monkeypatch):
+    backend = FrameBackend(FilterEngine(events))
+    take = backend._take
+    monkeypatch.setattr(backend, "_take", lambda columns, rows: take(columns, rows) if len(set(columns)) <= 2 else pytest.fail("all columns were taken"))
+    key = backend.key(country=["India", "Kenya"])
+    where = [("url_category", "==", "products")]
+    expected = events[events["country"].isin(["India", "Kenya"]) & (events["url_category"] == "products")]
+
+    assert backend.count(key, where=where) == len(expected)
+    assert backend.count(key, by="page_name", where=where).to_dict() == expected["page_name"].value_counts().to_dict()
+    assert backend.count(backend.key(), by=["country", "referrer"]).to_dict() == events.groupby(["country", "referrer"], observed=True).size().to_dict()
+    assert backend.nunique(key, "user_id", where=where) == expected["user_id"].nunique()
+
+
+def test_frame_backend_plain_counts_take_no_rows(events, monkeypatch):
+    backend = FrameBackend(FilterEngine(events))
+    monkeypatch.setattr(backend, "_take", lambda columns, rows: pytest.fail("rows were taken"))
+
+    assert backend.count(backend.key()) == len(events)
+    assert backend.count(backend.key(country=["India"])) == int((events["country"] == "India").sum())
+
+
+@pytest.mark.parametrize("out_of_core", [False, True], ids=["frame", "arrow"])
+def test_pages_match_pandas(events, tmp_path, out_of_core):
+    # Missing values sort last, whichever the direction
+    events.loc[events.sample(frac=0.1, random_state=0).index, "referrer"] = np.nan
+    backend = arrow_dataset(events, tmp_path / "events.arrow") if out_of_core else FrameBackend(FilterEngine(events))
+    key = backend.key(country=["India", "Kenya"])
+    selected = events[events["country"].isin(["India", "Kenya"])]
+    where = [("page_name", "contains", "demo")]
+
+    for order_by, descending, conditions in [(None, False, ()), ("referrer", False, ()), ("referrer", True, where), ("timestamp", True, where)]:
+        expected = selected[condition_mask(selected, conditions)]
+        if order_by is not None:
+            expected = expected.sort_values(order_by, ascending=not descending, kind="stable", na_position="last")
+        for offset in [0, 35, len(expected) - 10, len(expected) + 5]:
+            page = backend.page(key, offset, 20, order_by=order_by, descending=descending, where=conditions)
+            pd.testing.assert_frame_equal(
+                page.reset_index(drop=True), expected.iloc[offset:offset + 20].reset_index(drop=True), check_dtype=False, check_categorical=False,
+            )
+
@@ -0,0 +1,96 @@
+import gc
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import data_layer.cache as cache
+from data_layer.append import append_batch
+from data_layer.backend import ArrowDataset
+from data_layer.derived import prepare_dataset
+from data_layer.ingest import iter_upload, read_upload
+from data_layer.store import DatasetRegistry
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DATASET_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def cached_frame(key):
+    data = cache.load_cached_dataset(key)
+    assert isinstance(data, ArrowDataset)
+    return data.dataset.to_table().to_pandas()
+
+
+def in_time_order(df):
+    return df.sort_values(["timestamp", "session_id", "page_name"], kind="stable").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("numeric_ids", [False, True])
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+def test_streamed_upload_matches_the_in_memory_dataset(numeric_ids, engine, make_events, make_upload):
+    events = make_events(numeric_ids=numeric_ids).sample(frac=1, random_state=0)
+    data = events.iloc[:, :10].to_csv(index=False).encode()
+
+    rows = cache.save_streamed_dataset("streamed", iter_upload(make_upload(data), "log.csv", chunk_rows=100, engine=engine), "log.csv")
+
+    expected = prepare_dataset(read_upload(make_upload(data), "log.csv", engine=engine))
+    streamed = cached_frame("streamed")
+    assert rows == len(expected)
+    pd.testing.assert_frame_equal(in_time_order(streamed), in_time_order(expected), check_dtype=False)
+    for column in ["country", "page_name", "month", "quarter", "day_of_week"]:
+        assert list(streamed[column].cat.categories) == list(expected[column].cat.categories)
+
+
+def test_streamed_upload_with_numeric_then_text_ids(sample_csv, make_upload):
+    data = sample_csv.replace(b",s1,", b",1,").replace(b",s2,", b",2,") + b"2024-01-03 08:00:00,s3,u3,Kenya,Email,Home,info,No Purchase,AI,Unassigned\n"
+
+    cache.save_streamed_dataset("mixed", iter_upload(make_upload(data), "log.csv", chunk_rows=2, engine="pandas"), "log.csv")
+
+    assert cached_frame("mixed")["session_id"].astype(str).tolist() == ["1", "1", "2", "s3"]
+
+
+def test_eviction_keeps_the_files_of_datasets_in_use(events, monkeypatch):
+    registry = DatasetRegistry()
+    monkeypatch.setattr(cache, "get_registry", lambda: registry)
+    monkeypatch.setattr(cache, "DATASET_CACHE_KEEP", 1)
+    monkeypatch.setattr(cache, "OUT_OF_CORE_BYTES", 0)
+    cache.save_dataset("open", events, "open")
+    handle = registry.acquire("open", lambda: cache.load_cached_dataset("open"))
+
+    cache.save_dataset("newer", events, "newer")
+    cache.save_dataset("newest", events, "newest")
+    assert {dataset["key"] for dataset in cache.list_cached_datasets()} == {"open", "newest"}
+    assert handle.entry.dataset.count(handle.entry.dataset.key(), by="country").sum() == len(events)
+
+    # Once no session reads it, the file goes with the next save, and the registry forgets it
+    del handle
+    gc.collect()
+    cache.save_dataset("latest", events, "latest")
+    assert {dataset["key"] for dataset in cache.list_cached_datasets()} == {"latest"}
+    assert registry.forget_file("open")
+
+
+@pytest.mark.parametrize("numeric_ids", [False, True])
+def test_appended_datasets_write_only_the_batch(cache_dir, numeric_ids, make_events):
+    base = make_events(rows=400, numeric_ids=numeric_ids)
+    cache.save_dataset("base", base, "base")
+    # The first batch overlaps the dataset's time span, the second follows it
+    once, _, batch = append_batch(base, {}, make_events(rows=200, seed=1, numeric_ids=numeric_ids))
+    cache.save_appended_dataset("once", "base", once, batch, "once")
+    twice, _, batch = append_batch(once, {}, make_events(rows=200, seed=2, numeric_ids=numeric_ids, start="2024-06-01"))
+    cache.save_appended_dataset("twice", "once", twice, batch, "twice")
+
+    assert os.path.samefile(cache_dir / "base.arrow", cache_dir / "twice.arrow")
+    assert os.path.samefile(cache_dir / "once.1.arrow", cache_dir / "twice.1.arrow")
+    assert pa.ipc.open_file(str(cache_dir / "twice.2.arrow")).read_all().num_rows == len(batch)
+    pd.testing.assert_frame_equal(cache.load_cached_dataset("once"), once)
+    pd.testing.assert_frame_equal(cache.load_cached_dataset("twice"), twice)
+
+    # Without its base in the cache, the whole dataset is saved
+    cache.save_appended_dataset("unbased", "missing", twice, batch, "unbased")
+    assert not os.path.exists(cache_dir / "unbased.1.arrow")
+    pd.testing.assert_frame_equal(cache.load_cached_dataset("unbased"), twice)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.classify import bucket_membership, category_flags
+from data_layer.rollup import build_daily_rollup
+from data_layer.settings import PRODUCT_INTEREST_KEYWORDS
+
+PAGES = ["Home", "Virtual Assistant", "virtual assistant pricing", "UI/UX Design Generator", "Prototyping Tool Demo", "Software Testing Tool"]
+
+
+def test_category_flags_match_the_rows():
+    pages = pd.Series(["Home", "Schedule Demo", None, "schedule demo", "Home"])
+    expected = [isinstance(page, str) and "demo" in page.lower() for page in pages]
+
+    assert category_flags(pages.astype("category"), lambda labels: labels.str.lower().str.contains("demo")).tolist() == expected
+    # Plain text columns are classified the same way
+    assert category_flags(pages, lambda labels: labels.str.lower().str.contains("demo")).tolist() == expected
+
+
+def test_bucket_membership_matches_every_keyword_of_a_bucket():
+    pages = pd.Series(PAGES + [None, "Home"], dtype="category")
+    keywords = {"AI": "virtual assistant", "Design": ["ui/ux design generator", "prototyping tool"], "None": ["nothing"]}
+
+    membership, codes = bucket_membership(pages, keywords)
+    rows = membership[codes]
+    for column, bucket_keywords in enumerate(keywords.values()):
+        bucket_keywords = [bucket_keywords] if isinstance(bucket_keywords, str) else bucket_keywords
+        expected = [isinstance(page, str) and any(keyword in page.lower() for keyword in bucket_keywords) for page in pages]
+        assert rows[:, column].tolist() == expected
+
+
+def test_interest_counts_distinct_visitors_per_bucket(events):
+    events["page_name"] = pd.Categorical(np.random.default_rng(2).choice(PAGES, len(events)))
+    rollup = build_daily_rollup(events)
+
+    interest = rollup.interest(np.ones(len(rollup.cells), dtype=bool))
+    pages = events["page_name"].astype(str).str.lower()
+    for bucket, keywords in PRODUCT_INTEREST_KEYWORDS.items():
+        matches = np.logical_or.reduce([pages.str.contains(keyword, regex=False) for keyword in keywords])
+        assert interest[bucket] == events.loc[matches, "user_id"].nunique()
@@ -0,0 +1,44 @@
+import gzip
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from data_layer import settings
+from data_layer.backend import FrameBackend
+from data_layer.export import write_export
+from data_layer.filters import FilterEngine
+
+
+@pytest.mark.parametrize("export_format", ["csv", "csv.gz", "parquet"])
+def test_export_round_trip(events, tmp_path, monkeypatch, export_format):
+    # Several batches, so the header is written once and the row labels run on
+    monkeypatch.setattr("data_layer.backend.SCAN_BATCH_ROWS", 70)
+    backend = FrameBackend(FilterEngine(events))
+    key = backend.key(country=["India", "Kenya"])
+    expected = events[events["country"].isin(["India", "Kenya"])]
+    path = str(tmp_path / "export")
+
+    write_export(backend.row_batches(key), path, export_format)
+    if export_format == "parquet":
+        exported = pq.read_table(path).to_pandas()
+        pd.testing.assert_frame_equal(exported, expected.reset_index(drop=True), check_categorical=False)
+    else:
+        with (gzip.open if export_format == "csv.gz" else open)(path, "rb") as exported:
+            assert exported.read() == expected.to_csv().encode("utf-8")
+
+
+def test_raw_data_export_is_prepared_on_request_and_limited(events, page_app, monkeypatch):
+    monkeypatch.setattr(settings, "RAW_DATA_EXPORT_ROWS", 100)
+    at = page_app("pages/raw_data_page.py", events).run()
+    assert "raw_data_export" not in at.session_state
+    assert f"first 100 of {len(events):,} matching rows" in at.caption[-1].value
+
+    next(button for button in at.button if button.label == "Prepare download").click().run()
+    assert not at.exception
+    _, data = at.session_state["raw_data_export"]
+    assert data == events.head(100).to_csv().encode("utf-8")
+
+    # A different format is a different export; the prepared one is dropped
+    at.selectbox(key="raw_data_export_format").set_value("parquet").run()
+    assert "raw_data_export" not in at.session_state
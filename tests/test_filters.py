@@ -0,0 +1,63 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from data_layer.filters import FilterEngine
+
+
+def expected_positions(df, date_range=None, **selections):
+    mask = np.ones(len(df), dtype=bool)
+    if date_range is not None:
+        dates = df["timestamp"].dt.date
+        mask &= ((dates >= date_range[0]) & (dates <= date_range[1])).to_numpy()
+    for column, wanted in selections.items():
+        mask &= df[column].isin(wanted).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def positions(rows, n_rows):
+    return np.arange(n_rows)[rows]
+
+
+@pytest.fixture
+def refinements(monkeypatch):
+    """Base filter states the engine refined a selection from, in order."""
+    bases = []
+    original = FilterEngine._refine
+
+    def refine(self, key, start, stop, base_key, base):
+        bases.append(base_key)
+        return original(self, key, start, stop, base_key, base)
+
+    monkeypatch.setattr(FilterEngine, "_refine", refine)
+    return bases
+
+
+MARCH = (datetime.date(2024, 3, 1), datetime.date(2024, 3, 31))
+
+
+@pytest.mark.parametrize("broad, narrow", [
+    # A new filter on another column
+    ({"country": ["India", "Kenya"]}, {"country": ["India", "Kenya"], "referrer": ["Email"]}),
+    # Fewer values of the same column
+    ({"country": ["India", "Kenya"]}, {"country": ["Kenya"]}),
+    # A shorter date range
+    ({"country": ["India", "Kenya"]}, {"date_range": MARCH, "country": ["India", "Kenya"]}),
+])
+def test_narrower_states_are_refined_from_cached_selections(events, refinements, broad, narrow):
+    engine = FilterEngine(events)
+    broad_key = engine.key(**broad)
+    assert positions(engine.select(broad_key), len(events)).tolist() == expected_positions(events, **broad).tolist()
+
+    assert positions(engine.select(engine.key(**narrow)), len(events)).tolist() == expected_positions(events, **narrow).tolist()
+    assert refinements == [broad_key]
+
+
+def test_wider_states_are_evaluated_afresh(events, refinements):
+    engine = FilterEngine(events)
+    engine.select(engine.key(country=["Kenya"], referrer=["Email"]))
+
+    for selections in [{"country": ["India", "Kenya"], "referrer": ["Email"]}, {"country": ["Kenya"]}, {"date_range": MARCH, "referrer": ["Email"]}]:
+        assert positions(engine.select(engine.key(**selections)), len(events)).tolist() == expected_positions(events, **selections).tolist()
+    assert refinements == []
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.append import merge_batch
+from data_layer.filters import FilterEngine
+from data_layer.indexes import ColumnIndex
+
+
+def test_rows_match_isin_within_the_range():
+    values = pd.Series(pd.Categorical(["b", "a", None, "c", "a", "b", None, "a"], categories=["a", "b", "c"]))
+    index = ColumnIndex.from_column(values)
+
+    for wanted, start, stop in [({"a"}, 0, 8), ({"a", "c"}, 1, 7), ({"b", "unknown"}, 0, 5), ({"unknown"}, 0, 8), ({"a", "b"}, 3, 3)]:
+        expected = np.flatnonzero(values.isin(wanted).to_numpy())
+        assert index.rows(wanted, start, stop).tolist() == expected[(expected >= start) & (expected < stop)].tolist()
+
+
+def test_merged_indexes_match_fresh_ones(events, make_events):
+    # The batch overlaps the dataset's time span and brings a country of its own
+    batch = make_events(rows=200, seed=1)
+    batch["country"] = batch["country"].cat.rename_categories({"Kenya": "Peru"})
+    merged, positions, batch_positions = merge_batch(events, batch)
+    engine = FilterEngine(events).merge(merged, FilterEngine(batch), positions, batch_positions)
+
+    fresh = FilterEngine(merged)
+    assert engine.indexes.keys() == fresh.indexes.keys()
+    for column, index in engine.indexes.items():
+        assert list(index.categories) == list(fresh.indexes[column].categories)
+        assert index.row_ids.tolist() == fresh.indexes[column].row_ids.tolist()
+        assert index.offsets.tolist() == fresh.indexes[column].offsets.tolist()
@@ -0,0 +1,60 @@
+import gzip
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from data_layer.ingest import read_upload
+
+
+def zstd(data):
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, "zstd") as out:
+        out.write(data)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize("file_name", ["log.csv", "log.csv.zst"])
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+def test_bad_timestamp_falls_back_to_missing(file_name, engine, sample_csv, make_upload):
+    data = sample_csv.replace(b"2024-01-02 10:30:00", b"yesterday")
+    df = read_upload(make_upload(zstd(data) if file_name.endswith(".zst") else data), file_name, engine=engine)
+    assert len(df) == 3
+    assert df["timestamp"].isna().tolist() == [False, False, True]
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+def test_zstd_upload_reports_progress(engine, sample_csv, make_upload):
+    fractions = []
+    df = read_upload(make_upload(zstd(sample_csv)), "log.csv.zst", engine=engine, on_progress=lambda fraction, rows: fractions.append(fraction))
+    assert len(df) == 3
+    assert fractions and fractions[-1] is not None
+
+
+def test_malformed_row_after_the_first_block_restarts_with_pandas(monkeypatch, sample_csv, make_upload):
+    import data_layer.ingest as ingest
+
+    monkeypatch.setattr(ingest, "ARROW_CSV_BLOCK_BYTES", 256)
+    rows = sample_csv.splitlines()
+    data = b"\n".join(rows + rows[1:] * 20 + [rows[1] + b",extra"] + rows[1:] * 5) + b"\n"
+    # pandas rejects the extra field as well; a missing field is filled in instead
+    data = data.replace(rows[1] + b",extra", rows[1].rsplit(b",", 1)[0])
+    df = read_upload(make_upload(data), "log.csv", engine="arrow", chunk_rows=10)
+    assert len(df) == len(data.splitlines()) - 1
+    assert df["processed_by"].isna().sum() == 1
+
+
+@pytest.mark.parametrize("file_name", ["log.csv.gz", "log.csv.zst"])
+def test_expanded_size_of_compressed_uploads(file_name, monkeypatch, sample_csv, make_upload):
+    import data_layer.ingest as ingest
+
+    monkeypatch.setattr(ingest, "SIZE_SAMPLE_BYTES", 2 * 1024 * 1024)
+    ids = np.random.default_rng(0).integers(0, 10**6, 200_000)
+    data = sample_csv + b"".join(b"2024-01-03 08:00:00,s%d,u%d,Kenya,Email,Home,info,No Purchase,AI,Unassigned\n" % (i, i // 3) for i in ids)
+    upload = make_upload(gzip.compress(data) if file_name.endswith(".gz") else zstd(data))
+    upload.seek(5)
+
+    assert 0.7 < ingest.expanded_size(upload, file_name) / len(data) < 1.3
+    assert upload.tell() == 5
+    assert ingest.expanded_size(make_upload(gzip.compress(sample_csv)), "log.csv.gz") == len(sample_csv)
+    assert ingest.expanded_size(make_upload(sample_csv), "log.csv") == len(sample_csv)
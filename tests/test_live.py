@@ -0,0 +1,42 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import data_layer.settings as settings
+from data_layer.live import LiveIngest
+from data_layer.store import DatasetRegistry
+
+
+@pytest.fixture(params=["missing", "file"])
+def bad_directory(request, tmp_path):
+    if request.param == "file":
+        (tmp_path / "logs.csv").write_text("timestamp\n")
+        return str(tmp_path / "logs.csv")
+    return str(tmp_path / "missing")
+
+
+def test_unwatchable_directory_raises(bad_directory):
+    with pytest.raises(OSError):
+        LiveIngest(bad_directory, DatasetRegistry())
+
+
+def test_upload_page_warns_about_an_unwatchable_directory(bad_directory, monkeypatch, without_navigation):
+    monkeypatch.setattr(settings, "LIVE_INGEST_DIR", bad_directory)
+    at = AppTest.from_file("../upload.py").run()
+    assert not at.exception
+    assert any("Live data is unavailable" in warning.value for warning in at.warning)
+
+
+def test_live_files_add_only_their_new_events(events, tmp_path):
+    columns = list(events.columns[:10])
+    ingest = LiveIngest(str(tmp_path), DatasetRegistry(), settle_seconds=3600)
+    first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+    events.iloc[:300][columns].to_csv(first, index=False)
+    events.iloc[200:400][columns].to_csv(second, index=False)
+
+    ingest._ingest(str(first))
+    ingest._ingest(str(second))
+    assert len(ingest.handle.entry.df) == 400
+    # A rewritten file contributes only the events it didn't have before
+    events.iloc[:500][columns].to_csv(first, index=False)
+    ingest._ingest(str(first))
+    assert ingest.handle.entry.df["timestamp"].tolist() == events["timestamp"].iloc[:500].tolist()
@@ -0,0 +1,5 @@
+def test_approximate_counts_without_interest_pages(events, page_app):
+    # None of the page names match PRODUCT_INTEREST_KEYWORDS, so the interest sketch is empty
+    at = page_app("pages/overview.py", events).run()
+    at.toggle(key="approximate_counts").set_value(True).run()
+    assert not at.exception
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from data_layer.rollup import build_daily_rollup
+
+
+@pytest.fixture
+def events_with_missing_products(events):
+    # One event in five has no product at all
+    events.loc[np.random.default_rng(1).random(len(events)) < 0.2, "purchased_product"] = np.nan
+    return events
+
+
+def test_purchase_measures_match_the_pandas_expressions(events_with_missing_products):
+    df = events_with_missing_products
+    rollup = build_daily_rollup(df)
+    everything = np.ones(len(rollup.cells), dtype=bool)
+    purchases = df[df["purchased_product"] != "No Purchase"]
+
+    # KPI card: every event that isn't "No Purchase"
+    assert rollup.totals(everything)["purchases"] == purchases.shape[0]
+
+    # Per-group charts: count() skips events without a product
+    by_member = rollup.sum_by(everything, "processed_by", "named_purchases")
+    expected = purchases[purchases["processed_by"] != "Unassigned"].groupby("processed_by", observed=True)["purchased_product"].count()
+    assert by_member.drop("Unassigned").to_dict() == expected.to_dict()
+
+    by_month = rollup.sum_by(everything, ["month", "referrer"], "named_purchases")
+    expected = purchases.groupby([purchases["timestamp"].dt.to_period("M").astype(str), "referrer"], observed=True)["purchased_product"].count()
+    assert {(str(month), referrer): count for (month, referrer), count in by_month.items() if count} == {key: count for key, count in expected.items() if count}
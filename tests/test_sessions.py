@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.backend import condition_mask
+from data_layer.sessions import build_session_table
+from data_layer.settings import FUNNEL_STEPS
+
+
+def expected_funnel(df, strict=False):
+    reached = pd.DataFrame({step: condition_mask(df, conditions) for step, conditions in FUNNEL_STEPS.items()})
+    reached = reached.groupby(df["session_id"].to_numpy()).max()
+    if strict:
+        reached = reached.cummin(axis=1)
+    return reached.sum().astype(np.int64)
+
+
+def test_funnel_matches_pandas(events):
+    table = build_session_table(events)
+    for strict in (False, True):
+        assert table.funnel(table.select(), strict=strict).tolist() == expected_funnel(events, strict).tolist()
+
+    countries = ["Germany", "Kenya"]
+    selected = events[events["country"].isin(countries)]
+    assert table.funnel(table.select(countries=countries)).tolist() == expected_funnel(selected).tolist()
+
+
+def test_merge_matches_fresh_build(events, merge_halves):
+    merged = merge_halves(build_session_table)
+    assert merged.funnel(merged.select(), strict=True).tolist() == expected_funnel(events, strict=True).tolist()
+    fresh = build_session_table(events)
+    assert merged.sessions.sort_index()[["started", "ended", "first_referrer"]].equals(fresh.sessions.sort_index()[["started", "ended", "first_referrer"]])
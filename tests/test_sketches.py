@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from data_layer.sketches import HyperLogLog
+
+
+def sketch(cells, values):
+    return HyperLogLog.from_column(np.asarray(cells), pd.Series(values, dtype=object))
+
+
+def test_empty_sketch_counts_nothing():
+    empty = sketch([], [])
+    assert empty.count(np.ones(3, dtype=bool)) == 0
+    assert empty.count_by(np.ones(3, dtype=bool), np.array([0, 1, 1]), 2).tolist() == [0, 0]
+
+
+def test_empty_sketch_merges():
+    one = sketch([0], ["u1"])
+    merged = one.merge(sketch([], []), np.array([0]), np.array([1]))
+    assert merged.count(np.ones(2, dtype=bool)) == 1
+
+
+def test_one_key():
+    one = sketch([1], ["u1"])
+    assert one.count(np.array([False, True])) == 1
+    assert one.count(np.array([True, False])) == 0
+    assert one.count_by(np.array([True, True]), np.array([0, 1]), 2).tolist() == [0, 1]
+
+
+def test_estimate_is_close_to_the_distinct_count():
+    values = [f"u{i}" for i in range(5000)] * 2
+    assert abs(sketch(np.zeros(len(values), dtype=int), values).count(np.ones(1, dtype=bool)) - 5000) < 5000 * 0.06
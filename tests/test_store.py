@@ -0,0 +1,54 @@
+import gc
+import threading
+
+import pandas as pd
+
+from data_layer.store import DatasetRegistry
+
+
+def test_release_from_gc_while_lock_is_held():
+    registry = DatasetRegistry()
+    frame = pd.DataFrame({"a": [1, 2, 3]})
+    handle = registry.acquire("key", lambda: frame)
+    # Session state keeps handles in reference cycles; only the cyclic GC finalizes them
+    cycle = {"handle": handle}
+    cycle["self"] = cycle
+    del handle, cycle
+
+    def collect_holding_lock():
+        with registry._lock:
+            gc.collect()
+
+    collector = threading.Thread(target=collect_holding_lock, daemon=True)
+    collector.start()
+    collector.join(timeout=10)
+    assert not collector.is_alive(), "releasing a handle deadlocked on the registry lock"
+
+    # The queued release is applied by the next call that takes the lock
+    registry.acquire("other", lambda: frame)
+    assert registry._entries["key"].sessions == 0
+
+
+def test_artifact_built_during_replace_is_not_kept_for_the_new_version():
+    registry = DatasetRegistry()
+    old, new = pd.DataFrame({"a": range(10)}), pd.DataFrame({"a": range(25)})
+    entry = registry.acquire("key", lambda: old).entry
+
+    def build_while_replaced(df):
+        registry.replace(entry, new, {})
+        return len(df)
+
+    assert registry.artifact(entry, "rows", build_while_replaced) == 10
+    assert registry.artifact(entry, "rows", len) == 25
+
+
+def test_writes_to_a_shared_frame_never_reach_other_sessions():
+    # Copy-on-write is deliberately process-wide (see data_layer.store)
+    assert pd.get_option("mode.copy_on_write")
+    frame = pd.DataFrame({"a": [1, 2, 3]})
+    registry = DatasetRegistry()
+    first, second = registry.acquire("key", lambda: frame), registry.acquire("key", lambda: frame)
+
+    selection = first.entry.df.iloc[:2]
+    selection.loc[0, "a"] = 10
+    assert second.entry.df["a"].tolist() == [1, 2, 3]
@@ -0,0 +1,20 @@
+from data_layer.users import build_user_visits
+
+
+def test_summary_matches_groupby(events):
+    visits = build_user_visits(events)
+    summary = visits.summary(visits.select())
+
+    expected = events.groupby("user_id", observed=True).agg(
+        first_seen=("date", "min"), last_seen=("date", "max"), events=("timestamp", "size"), sessions=("session_id", "nunique"),
+    )
+    summary = summary.sort_index()
+    assert summary.index.tolist() == expected.index.tolist()
+    for column in ["first_seen", "last_seen", "events", "sessions"]:
+        assert summary[column].tolist() == expected[column].tolist()
+
+
+def test_merge_matches_fresh_build(events, merge_halves):
+    merged = merge_halves(build_user_visits)
+    fresh = build_user_visits(events)
+    assert merged.summary(merged.select()).sort_index().equals(fresh.summary(fresh.select()).sort_index())
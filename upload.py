@@ -1,5 +1,16 @@
+from datetime import datetime
+
 import streamlit as st
-import pandas as pd
+
+from data_layer.append import append_batch
+from data_layer.backend import get_query_backend
+from data_layer.cache import appended_key, content_key, list_cached_datasets, load_cached_dataset, save_appended_dataset, save_dataset, save_streamed_dataset
+from data_layer.derived import prepare_dataset
+from data_layer.ingest import UPLOAD_TYPES, expanded_size, iter_upload, read_upload
+from data_layer.live import get_live_ingest
+from data_layer.rollup import get_daily_rollup
+from data_layer.settings import LIVE_INGEST_DIR, STREAMED_UPLOAD_BYTES
+from data_layer.store import get_dataset_handle, publish_dataset, seed_artifacts
 
 st.set_page_config(page_title="Upload Data", layout="wide")
 st.markdown("""
@@ -31,18 +42,120 @@ with st.sidebar:
             st.markdown("---")  # Separator
 
 st.title("Welcome to the Dashboard!")
-st.subheader("Please upload your web data logs in CSV format to proceed.")
+st.subheader("Please upload your web data logs (CSV, gzip/zstd CSV, Parquet, Arrow or NDJSON) to proceed.")
+
+uploaded_file = st.file_uploader("Upload data file", type=UPLOAD_TYPES)
+
+# With a dataset already open, a new file (e.g. yesterday's logs) can be added to it instead.
+# Out-of-core datasets are read-only: they aren't in memory to merge into.
+current_dataset = get_dataset_handle()
+append_mode = current_dataset is not None and current_dataset.entry.df is not None and st.toggle(
+    "Append to the current dataset",
+    key="append_mode",
+    help="Adds the file's events to the dataset that is open now. Events already in it (same session, timestamp and page) are skipped.",
+)
+
+# Artifacts brought up to date by an append, handed to the new dataset before anything is rebuilt
+updated_artifacts = {}
+
+
+def open_dataset(cache_key, load, name):
+    publish_dataset(cache_key, load)
+    seed_artifacts(updated_artifacts)
+    st.session_state["dataset_name"] = name
+    with st.spinner("Building summaries..."):
+        get_daily_rollup()
+        get_query_backend()
+    st.success("Data uploaded successfully!")
+    st.info("You can now navigate to the other pages in the sidebar.")
+    st.switch_page("pages/overview.py")
 
-uploaded_file = st.file_uploader("Upload CSV file", type=["csv"])
 
 if uploaded_file is not None:
     try:
-        df = pd.read_csv(uploaded_file, parse_dates=["timestamp"])
-        st.session_state["uploaded_data"] = df
-        st.success("Data uploaded successfully!")
-        st.info("You can now navigate to the other pages in the sidebar.")
-        st.switch_page("pages/overview.py")
+        # A file another session has open is shared in memory; one uploaded before is
+        # reopened from the local cache; anything else is parsed (and cached)
+        cache_key = content_key(uploaded_file)
+        dataset_name = uploaded_file.name
+        if append_mode:
+            cache_key = appended_key(current_dataset.key, cache_key)
+            dataset_name = f"{st.session_state.get('dataset_name', 'dataset')} + {uploaded_file.name}"
+
+        def show_progress(progress_bar):
+            def update(fraction, rows_read):
+                if fraction is None:
+                    progress_bar.progress(0.0, text=f"Read {rows_read:,} rows...")
+                else:
+                    progress_bar.progress(fraction, text=f"Read {rows_read:,} rows ({fraction:.0%})")
+
+            return update
+
+        def read_uploaded_file():
+            progress_bar = st.progress(0.0, text="Reading upload...")
+            df = prepare_dataset(read_upload(uploaded_file, uploaded_file.name, on_progress=show_progress(progress_bar)))
+            progress_bar.empty()
+            return df
+
+        def load_upload():
+            df = load_cached_dataset(cache_key)
+            if df is None and append_mode:
+                # Only the new file is parsed; the dataset's summaries and indexes are updated
+                # with its events instead of being rebuilt, and only they are written to the cache
+                df, artifacts, batch = append_batch(current_dataset.entry.df, dict(current_dataset.entry.artifacts), read_uploaded_file())
+                updated_artifacts.update(artifacts)
+                save_appended_dataset(cache_key, current_dataset.key, df, batch, dataset_name)
+            elif df is None and expanded_size(uploaded_file, uploaded_file.name) > STREAMED_UPLOAD_BYTES:
+                # Too large to hold in memory once parsed (compressed files count decompressed):
+                # the chunks are written to the cache as they are read and the dataset is queried
+                # from there, out of core
+                progress_bar = st.progress(0.0, text="Reading upload...")
+                chunks = iter_upload(uploaded_file, uploaded_file.name, on_progress=show_progress(progress_bar))
+                save_streamed_dataset(cache_key, chunks, dataset_name)
+                progress_bar.empty()
+                df = load_cached_dataset(cache_key)
+            elif df is None:
+                df = read_uploaded_file()
+                save_dataset(cache_key, df, dataset_name)
+            return df
+
+        open_dataset(cache_key, load_upload, dataset_name)
     except Exception as e:
-        st.error(f"Error loading CSV: {e}")
+        st.error(f"Error loading file: {e}")
 else:
     st.info("Waiting for file upload...")
+
+    recent_datasets = list_cached_datasets()
+    if recent_datasets:
+        st.subheader("Or reopen a recent upload")
+        recent_dataset = st.selectbox(
+            "Recent uploads",
+            options=recent_datasets,
+            format_func=lambda dataset: f"{dataset['name']} ({dataset['rows']:,} rows, uploaded {datetime.fromtimestamp(dataset['saved_at']):%Y-%m-%d %H:%M})",
+        )
+        if st.button("Open", key="open_recent_dataset"):
+
+            def load_recent():
+                df = load_cached_dataset(recent_dataset["key"])
+                if df is None:
+                    raise FileNotFoundError("That upload is no longer available. Please upload the file again.")
+                return df
+
+            try:
+                open_dataset(recent_dataset["key"], load_recent, recent_dataset["name"])
+            except FileNotFoundError as e:
+                st.error(str(e))
+
+    # Live mode: files dropped into the configured directory are appended in the background
+    if LIVE_INGEST_DIR:
+        st.subheader("Or follow live data")
+        try:
+            live_ingest = get_live_ingest(LIVE_INGEST_DIR)
+        except OSError as e:
+            # A misconfigured directory only disables live mode; uploads keep working
+            st.warning(f"Live data is unavailable: the directory {LIVE_INGEST_DIR} can't be watched ({e.strerror or e}).")
+        else:
+            st.caption(f"New files in {live_ingest.directory} are added automatically ({live_ingest.files_ingested} ingested so far).")
+            if live_ingest.last_error:
+                st.warning(f"The last file could not be ingested: {live_ingest.last_error}")
+            if st.button("Open live dataset", key="open_live_dataset", disabled=not live_ingest.available):
+                open_dataset(live_ingest.key, lambda: live_ingest.handle.entry.df, "Live data")